@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AdminUser, AdminLog
+from .models import AdminUser, AdminLog, DailyStat
 
 
 @admin.register(AdminUser)
@@ -18,3 +18,10 @@ class AdminLogAdmin(admin.ModelAdmin):
     search_fields = ['admin__username', 'description']
     readonly_fields = ['created_at']
     ordering = ['-created_at']
+
+
+@admin.register(DailyStat)
+class DailyStatAdmin(admin.ModelAdmin):
+    list_display = ['date', 'active_users', 'weekly_active_users', 'monthly_active_users', 'new_users', 'new_posts', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at']
+    ordering = ['-date']
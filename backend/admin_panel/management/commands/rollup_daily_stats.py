@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from admin_panel import stats
+
+
+class Command(BaseCommand):
+    help = '生成每日统计汇总（日/周/月活跃用户、新增用户、新增分享），建议每天凌晨执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            help='汇总截至昨天的最近几天 (默认: 1，即只汇总昨天)',
+        )
+        parser.add_argument(
+            '--date',
+            type=str,
+            help='只汇总指定日期 (YYYY-MM-DD)',
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                date = parse_date(options['date'])
+            except ValueError:
+                date = None
+            if date is None:
+                raise CommandError('日期格式错误，应为 YYYY-MM-DD')
+            dates = [date]
+        else:
+            yesterday = timezone.localdate() - timedelta(days=1)
+            dates = [yesterday - timedelta(days=i) for i in reversed(range(options['days']))]
+
+        for date in dates:
+            stat = stats.rollup_day(date)
+            self.stdout.write(
+                f'- {stat.date}: 活跃用户 {stat.active_users}, '
+                f'近7日活跃 {stat.weekly_active_users}, 近30日活跃 {stat.monthly_active_users}, '
+                f'新增用户 {stat.new_users}, 新增分享 {stat.new_posts}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'成功汇总 {len(dates)} 天的统计数据'))
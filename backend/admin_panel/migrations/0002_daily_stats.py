@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('active_users', models.IntegerField(default=0, verbose_name='活跃用户数')),
+                ('new_users', models.IntegerField(default=0, verbose_name='新增用户数')),
+                ('new_posts', models.IntegerField(default=0, verbose_name='新增分享数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '每日统计',
+                'verbose_name_plural': '每日统计',
+                'db_table': 'daily_stats',
+                'ordering': ['date'],
+            },
+        ),
+    ]
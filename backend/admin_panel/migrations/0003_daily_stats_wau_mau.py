@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0002_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystat',
+            name='monthly_active_users',
+            field=models.IntegerField(default=0, verbose_name='近30日活跃用户数'),
+        ),
+        migrations.AddField(
+            model_name='dailystat',
+            name='weekly_active_users',
+            field=models.IntegerField(default=0, verbose_name='近7日活跃用户数'),
+        ),
+    ]
@@ -76,3 +76,24 @@ class AdminLog(models.Model):
 
     def __str__(self):
         return f'{self.admin.username} {self.get_action_display()} {self.get_target_type_display()}#{self.target_id}'
+
+
+class DailyStat(models.Model):
+    """每日统计汇总表（由 rollup_daily_stats 命令生成）"""
+    date = models.DateField(unique=True, verbose_name='日期')
+    active_users = models.IntegerField(default=0, verbose_name='活跃用户数')
+    weekly_active_users = models.IntegerField(default=0, verbose_name='近7日活跃用户数')
+    monthly_active_users = models.IntegerField(default=0, verbose_name='近30日活跃用户数')
+    new_users = models.IntegerField(default=0, verbose_name='新增用户数')
+    new_posts = models.IntegerField(default=0, verbose_name='新增分享数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'daily_stats'
+        verbose_name = '每日统计'
+        verbose_name_plural = '每日统计'
+        ordering = ['date']
+
+    def __str__(self):
+        return f'{self.date} 活跃用户 {self.active_users}'
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from community.models import Post
 from .models import AdminUser, AdminLog
 
 
@@ -83,3 +84,30 @@ class AdminLogCreateSerializer(serializers.ModelSerializer):
             'action', 'target_type', 'target_id', 'description',
             'ip_address', 'user_agent'
         ]
+
+
+class ModerationPostSerializer(serializers.ModelSerializer):
+    """内容审核列表序列化器（只包含审核所需字段）"""
+    user_id = serializers.IntegerField(read_only=True)
+    user_nickname = serializers.CharField(source='user.nickname', read_only=True)
+    user_avatar_url = serializers.CharField(source='user.avatar_url', read_only=True)
+    image_urls = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Post
+        fields = [
+            'id', 'user_id', 'user_nickname', 'user_avatar_url',
+            'shop_name', 'shop_price', 'comment', 'location_address',
+            'status', 'likes_count', 'created_at', 'image_urls'
+        ]
+    
+    def get_image_urls(self, obj):
+        return [image.image_url for image in obj.images.all()]
+
+
+class BulkModerationSerializer(serializers.Serializer):
+    """批量审核序列化器"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500
+    )
+    reason = serializers.CharField(max_length=200, required=False, allow_blank=True)
@@ -0,0 +1,90 @@
+"""
+管理后台统计
+
+用户活跃数据来自每日活跃记录表 user_daily_activity（登录时写入，每个用户每天一条）。
+已结束的日期从每日统计表 daily_stats 读取（由 rollup_daily_stats 命令生成），当天和
+汇总表缺失的日期按日期范围实时统计，多天的数据在一次按日期分组的查询中得到。
+近7日、30日活跃用户需要跨多天去重，仪表盘读取截至昨天的汇总值，不随请求实时计算。
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from community.models import Post
+from users.models import User, UserActivity
+from .models import DailyStat
+
+WEEK_DAYS = 7
+MONTH_DAYS = 30
+
+
+def day_range(date):
+    """返回某天在当前时区的 [开始, 结束) 时间"""
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def active_users(date):
+    """截至某天的日、周、月活跃用户数（周、月为含当天的最近7天、30天）"""
+    return UserActivity.objects.filter(
+        date__gt=date - timedelta(days=MONTH_DAYS), date__lte=date
+    ).aggregate(
+        active_users=Count('user', filter=Q(date=date)),
+        weekly_active_users=Count(
+            'user', distinct=True, filter=Q(date__gt=date - timedelta(days=WEEK_DAYS))
+        ),
+        monthly_active_users=Count('user', distinct=True),
+    )
+
+
+def compute_day(date):
+    """实时统计某天的数据"""
+    start, end = day_range(date)
+    return {
+        **active_users(date),
+        'new_users': User.objects.filter(created_at__gte=start, created_at__lt=end).count(),
+        'new_posts': Post.objects.filter(created_at__gte=start, created_at__lt=end).count(),
+    }
+
+
+def rollup_day(date):
+    """生成或更新某天的汇总记录"""
+    stat, _ = DailyStat.objects.update_or_create(date=date, defaults=compute_day(date))
+    return stat
+
+
+def latest_rollup():
+    """截至昨天的汇总记录；昨天尚未汇总时先生成（每天只需计算一次）"""
+    yesterday = timezone.localdate() - timedelta(days=1)
+    return DailyStat.objects.filter(date=yesterday).first() or rollup_day(yesterday)
+
+
+def activity_trend(days=7):
+    """最近 days 天（含今天）的活跃用户数，按日期升序"""
+    today = timezone.localdate()
+    start_date = today - timedelta(days=days - 1)
+
+    counts = dict(
+        DailyStat.objects.filter(
+            date__gte=start_date, date__lt=today
+        ).values_list('date', 'active_users')
+    )
+    # 今天和尚未汇总的日期一次分组查询补齐
+    missing = [
+        start_date + timedelta(days=i) for i in range(days)
+        if start_date + timedelta(days=i) not in counts
+    ]
+    if missing:
+        live = dict(
+            UserActivity.objects.filter(
+                date__gte=missing[0], date__lte=today
+            ).values('date').annotate(count=Count('id')).order_by().values_list('date', 'count')
+        )
+        for date in missing:
+            counts[date] = live.get(date, 0)
+
+    return [
+        {'date': date.strftime('%Y-%m-%d'), 'active_users': counts[date]}
+        for date in sorted(counts)
+    ]
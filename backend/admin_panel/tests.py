@@ -1,3 +1,148 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from community.models import Post, PostImage
+from users.models import User, UserActivity
+from .models import AdminLog, AdminUser, DailyStat
+
+
+class DashboardTests(TestCase):
+    """仪表盘统计"""
+
+    def setUp(self):
+        today = timezone.localdate()
+        regular = User.objects.create(openid='regular')
+        for days in [0, 1, 3, 20]:
+            UserActivity.record(regular, today - timedelta(days=days))
+        UserActivity.record(User.objects.create(openid='yesterday'), today - timedelta(days=1))
+        UserActivity.record(User.objects.create(openid='old'), today - timedelta(days=40))
+
+    def get_dashboard(self):
+        return self.client.get('/api/admin/admin-users/dashboard/')
+
+    def test_activity_trend(self):
+        response = self.get_dashboard()
+        self.assertEqual(response.status_code, 200)
+        trend = response.data['activity_trend']
+        self.assertEqual(len(trend), 7)
+        self.assertEqual(trend[-1]['date'], timezone.localdate().strftime('%Y-%m-%d'))
+        self.assertEqual([day['active_users'] for day in trend[-4:]], [1, 0, 2, 1])
+        summary = response.data['summary']
+        self.assertEqual(summary['today_active_users'], 1)
+        self.assertEqual(summary['weekly_active_users'], 2)
+        self.assertEqual(summary['monthly_active_users'], 2)
+        self.assertEqual(summary['total_users'], 3)
+        # 周、月活跃为截至昨天的汇总值，首次访问时生成昨天的汇总记录
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.assertEqual(summary['active_users_date'], yesterday.strftime('%Y-%m-%d'))
+        self.assertTrue(DailyStat.objects.filter(date=yesterday).exists())
+
+    def test_query_count_constant(self):
+        call_command('rollup_daily_stats', days=6, stdout=StringIO())
+        self.assertEqual(DailyStat.objects.count(), 6)
+        yesterday = DailyStat.objects.get(date=timezone.localdate() - timedelta(days=1))
+        self.assertEqual(
+            (yesterday.active_users, yesterday.weekly_active_users, yesterday.monthly_active_users),
+            (2, 2, 2),
+        )
+        # 用户总数 + 状态分布 + 汇总表趋势 + 今日活跃 + 昨天汇总 + 待审核分享
+        with self.assertNumQueries(6):
+            response = self.get_dashboard()
+        self.assertEqual([day['active_users'] for day in response.data['activity_trend'][-4:]], [1, 0, 2, 1])
+
+    def test_record_is_idempotent(self):
+        user = User.objects.get(openid='yesterday')
+        UserActivity.record(user)
+        UserActivity.record(user)
+        self.assertEqual(UserActivity.objects.filter(user=user).count(), 2)
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class ModerationListTests(TestCase):
+    """内容审核列表游标分页"""
+
+    def setUp(self):
+        self.user = User.objects.create(openid='moderator', nickname='审核员')
+        for i in range(5):
+            post = Post.objects.create(user=self.user, shop_name=f'烧烤店{i}', shop_price=50, comment='好吃', status='pending')
+            PostImage.objects.create(post=post, image_url=f'https://example.com/{i}.jpg')
+
+    def get(self, url):
+        return self.client.get(url, HTTP_X_OPENID='moderator')
+
+    def test_cursor_pages(self):
+        # 用户 + 分享（含用户） + 图片
+        with self.assertNumQueries(3):
+            response = self.get('/api/admin/moderation/?page_size=3')
+        self.assertEqual(response.status_code, 200)
+        first_page = response.data['results']
+        self.assertEqual(len(first_page), 3)
+        self.assertEqual(first_page[0]['user_nickname'], '审核员')
+        self.assertEqual(len(first_page[0]['image_urls']), 1)
+
+        response = self.get(response.data['next'])
+        ids = [post['id'] for post in first_page + response.data['results']]
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertIsNone(response.data['next'])
+
+    def test_search(self):
+        Post.objects.create(user=self.user, shop_name='K烤肉', shop_price=50, comment='好吃', status='pending')
+        response = self.get('/api/admin/moderation/?search=烤肉')
+        self.assertEqual([post['shop_name'] for post in response.data['results']], ['K烤肉'])
+        # 单个字母没有索引词元，回退为字段 icontains
+        response = self.get('/api/admin/moderation/?search=K')
+        self.assertEqual([post['shop_name'] for post in response.data['results']], ['K烤肉'])
+        response = self.get('/api/admin/moderation/?search=审核')
+        self.assertEqual(len(response.data['results']), 6)
+
+
+class BulkModerationTests(TestCase):
+    """批量审核操作"""
+
+    def setUp(self):
+        self.admin = AdminUser.objects.create(username='admin')
+        user = User.objects.create(openid='author', nickname='作者')
+        self.posts = [
+            Post.objects.create(user=user, shop_name=f'烧烤店{i}', shop_price=50, comment='好吃', status='pending')
+            for i in range(3)
+        ]
+
+    def post(self, action, data):
+        return self.client.post(
+            f'/api/admin/moderation/{action}/', data, content_type='application/json',
+            HTTP_X_ADMIN_ID=str(self.admin.id),
+        )
+
+    def test_bulk_approve(self):
+        ids = [post.id for post in self.posts[:2]]
+        response = self.post('bulk_approve', {'ids': ids + [999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['success_count'], 2)
+        self.assertEqual(
+            [result['success'] for result in response.data['results']], [True, True, False]
+        )
+        self.assertEqual(Post.objects.filter(status='approved').count(), 2)
+        self.assertEqual(AdminLog.objects.filter(action='approve').count(), 2)
+
+    def test_bulk_reject_and_delete(self):
+        response = self.post('bulk_reject', {'ids': [self.posts[0].id], 'reason': '图片模糊'})
+        self.assertEqual(response.data['success_count'], 1)
+        self.assertIn('图片模糊', AdminLog.objects.get(action='reject').description)
+
+        response = self.post('bulk_delete', {'ids': [post.id for post in self.posts]})
+        self.assertEqual(response.data['success_count'], 3)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(AdminLog.objects.filter(action='delete').count(), 3)
+
+    def test_requires_admin(self):
+        response = self.client.post(
+            '/api/admin/moderation/bulk_approve/', {'ids': [self.posts[0].id]},
+            content_type='application/json',
+        )
+        self.assertIn(response.status_code, [401, 403])
+        self.assertFalse(Post.objects.filter(status='approved').exists())
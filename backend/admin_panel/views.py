@@ -4,15 +4,21 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Count, Q
-from datetime import datetime, timedelta
+from datetime import datetime
+from api.permissions import IsAdminUser
 from .models import AdminUser, AdminLog
 from .serializers import (
     AdminUserSerializer, AdminUserCreateSerializer, AdminUserUpdateSerializer,
-    AdminLoginSerializer, AdminLogSerializer, AdminLogCreateSerializer
+    AdminLoginSerializer, AdminLogSerializer, AdminLogCreateSerializer,
+    ModerationPostSerializer, BulkModerationSerializer
 )
 from users.models import User
 from community.models import Post
+from community import feed_cache
+from community.pagination import KeysetPagination
+from . import stats
 
 
 class AdminUserViewSet(viewsets.ModelViewSet):
@@ -65,38 +71,24 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
         """管理后台仪表盘数据"""
-        # 基础统计
+        # 基础统计：帖子总数和待审核数由状态分布一次分组查询得到
         total_users = User.objects.count()
-        total_posts = Post.objects.count()
-        pending_posts = Post.objects.filter(status='pending').count()
-        
-        # 今日活跃用户（今日有登录的用户）
-        today = timezone.now().date()
-        today_active_users = User.objects.filter(
-            last_login_at__date=today
-        ).count()
+        content_stats = list(Post.objects.values('status').annotate(
+            count=Count('id')
+        ).order_by('status'))
+        total_posts = sum(row['count'] for row in content_stats)
+        pending_posts = next((row['count'] for row in content_stats if row['status'] == 'pending'), 0)
         
-        # 最近7天用户活跃度趋势
-        activity_trend = []
-        for i in range(7):
-            date = today - timedelta(days=i)
-            active_count = User.objects.filter(
-                last_login_at__date=date
-            ).count()
-            activity_trend.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'active_users': active_count
-            })
+        # 最近7天用户活跃度趋势（已结束的日期读取每日汇总表，最后一天为今日活跃）
+        activity_trend = stats.activity_trend(days=7)
         
-        # 内容状态分布
-        content_stats = Post.objects.values('status').annotate(
-            count=Count('id')
-        ).order_by('status')
+        # 近7日、近30日活跃用户读取截至昨天的汇总
+        rollup = stats.latest_rollup()
         
         # 最新待审核内容
         recent_pending = Post.objects.filter(
             status='pending'
-        ).select_related('user').order_by('-created_at')[:5]
+        ).for_feed().order_by('-created_at')[:5]
         
         from community.serializers import PostListSerializer
         
@@ -105,10 +97,13 @@ class AdminUserViewSet(viewsets.ModelViewSet):
                 'total_users': total_users,
                 'total_posts': total_posts,
                 'pending_posts': pending_posts,
-                'today_active_users': today_active_users,
+                'today_active_users': activity_trend[-1]['active_users'],
+                'weekly_active_users': rollup.weekly_active_users,
+                'monthly_active_users': rollup.monthly_active_users,
+                'active_users_date': rollup.date.strftime('%Y-%m-%d'),
             },
-            'activity_trend': list(reversed(activity_trend)),
-            'content_stats': list(content_stats),
+            'activity_trend': activity_trend,
+            'content_stats': content_stats,
             'recent_pending': PostListSerializer(recent_pending, many=True).data
         })
     
@@ -140,6 +135,12 @@ class AdminLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AdminLogSerializer
 
 
+class ModerationPagination(KeysetPagination):
+    """内容审核列表分页器"""
+    page_size = 20
+    max_page_size = 100
+
+
 class ContentModerationViewSet(viewsets.ViewSet):
     """内容审核视图集"""
     
@@ -148,24 +149,30 @@ class ContentModerationViewSet(viewsets.ViewSet):
         status_filter = request.query_params.get('status', 'pending')
         ordering = request.query_params.get('ordering', '-created_at')
         
-        queryset = Post.objects.filter(status=status_filter).select_related('user')
+        queryset = Post.objects.filter(status=status_filter).for_feed()
         
         # 搜索
         search = request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(shop_name__icontains=search) |
-                Q(shop_location__icontains=search) |
-                Q(user__nickname__icontains=search)
-            )
+            from community.search import fallback_q, matching_tokens
+            matches = matching_tokens(search)
+            condition = Q(user__nickname__icontains=search)
+            if matches is not None:
+                condition |= Q(id__in=matches.values('post_id'))
+            else:
+                condition |= fallback_q(search)
+            queryset = queryset.filter(condition)
         
-        # 排序
-        if ordering in ['created_at', '-created_at', 'likes_count', '-likes_count']:
-            queryset = queryset.order_by(ordering)
+        # 排序（与 (status, created_at)、(status, likes_count) 索引对应）
+        if ordering not in ['created_at', '-created_at', 'likes_count', '-likes_count']:
+            ordering = '-created_at'
+        queryset = queryset.order_by(ordering)
         
-        from community.serializers import PostListSerializer
-        serializer = PostListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # 游标分页，沿 next 链接翻页
+        paginator = ModerationPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ModerationPostSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -174,6 +181,7 @@ class ContentModerationViewSet(viewsets.ViewSet):
             post = Post.objects.get(id=pk)
             post.status = 'approved'
             post.save(update_fields=['status'])
+            feed_cache.invalidate()
             
             # 记录操作日志
             admin_user = request.user  # 需要实现管理员认证中间件
@@ -190,6 +198,7 @@ class ContentModerationViewSet(viewsets.ViewSet):
             post = Post.objects.get(id=pk)
             post.status = 'rejected'
             post.save(update_fields=['status'])
+            feed_cache.invalidate()
             
             # 记录操作日志
             admin_user = request.user
@@ -207,6 +216,7 @@ class ContentModerationViewSet(viewsets.ViewSet):
             post = Post.objects.get(id=pk)
             shop_name = post.shop_name
             post.delete()
+            feed_cache.invalidate()
             
             # 记录操作日志
             admin_user = request.user
@@ -217,6 +227,80 @@ class ContentModerationViewSet(viewsets.ViewSet):
         except Post.DoesNotExist:
             return Response({'error': '内容不存在'}, status=status.HTTP_404_NOT_FOUND)
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_approve(self, request):
+        """批量审核通过"""
+        return self._bulk_moderate(request, 'approve')
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_reject(self, request):
+        """批量审核拒绝"""
+        return self._bulk_moderate(request, 'reject')
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_delete(self, request):
+        """批量删除内容"""
+        return self._bulk_moderate(request, 'delete')
+    
+    def _bulk_moderate(self, request, action):
+        """批量处理分享：一条 UPDATE（或一次删除）完成修改，操作日志一次批量写入"""
+        serializer = BulkModerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        reason = serializer.validated_data.get('reason') or (
+            '违规内容' if action == 'delete' else '不符合社区规范'
+        )
+        
+        with transaction.atomic():
+            shop_names = dict(
+                Post.objects.select_for_update().filter(id__in=ids).values_list('id', 'shop_name')
+            )
+            posts = Post.objects.filter(id__in=list(shop_names))
+            if action == 'approve':
+                posts.update(status='approved', updated_at=timezone.now())
+            elif action == 'reject':
+                posts.update(status='rejected', updated_at=timezone.now())
+            else:
+                posts.delete()
+            
+            # 记录操作日志
+            ip_address = self._get_client_ip(request)
+            user_agent = request.META.get('HTTP_USER_AGENT', '')
+            AdminLog.objects.bulk_create([
+                AdminLog(
+                    admin=request.user,
+                    action=action,
+                    target_type='post',
+                    target_id=post_id,
+                    description=self._bulk_description(action, shop_name, reason),
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                )
+                for post_id, shop_name in shop_names.items()
+            ])
+        
+        if shop_names:
+            feed_cache.invalidate()
+        
+        return Response({
+            'success_count': len(shop_names),
+            'results': [
+                {'id': post_id, 'success': True} if post_id in shop_names
+                else {'id': post_id, 'success': False, 'error': '内容不存在'}
+                for post_id in ids
+            ],
+        })
+    
+    def _bulk_description(self, action, shop_name, reason):
+        """批量操作日志描述，与单条操作一致"""
+        if action == 'approve':
+            return f'审核通过分享：{shop_name}'
+        if action == 'reject':
+            return f'审核拒绝分享：{shop_name}，原因：{reason}'
+        return f'删除分享：{shop_name}，原因：{reason}'
+    
     def _create_log(self, admin_user, action, target_type, target_id, description, request):
         """创建操作日志"""
         AdminLog.objects.create(
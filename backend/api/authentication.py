@@ -2,6 +2,13 @@ from django.contrib.auth.models import AnonymousUser
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from users.models import User
+from users.cache import get_active_user
+
+
+def get_wechat_user(request):
+    """获取当前请求已认证的微信用户，未登录时返回 None"""
+    user = getattr(request, 'user', None)
+    return user if isinstance(user, User) else None
 
 
 class WechatAuthentication(BaseAuthentication):
@@ -13,11 +20,10 @@ class WechatAuthentication(BaseAuthentication):
         if not openid:
             return None
         
-        try:
-            user = User.objects.get(openid=openid, is_active=True)
-            return (user, None)
-        except User.DoesNotExist:
+        user = get_active_user(openid)
+        if user is None:
             return None
+        return (user, None)
     
     def authenticate_header(self, request):
         return 'X-Openid'
@@ -0,0 +1,466 @@
+"""
+上传图片的衍生图处理
+
+原图保存后，由进程内线程池生成列表页使用的缩略图和限制尺寸的 WebP 图。衍生图按 EXIF
+方向旋转后重新编码，不保留 EXIF（包括拍摄位置）。衍生图与原图放在同一目录，文件名为
+“原文件名_规格.webp”，可由原图地址直接推算；生成完成后标记引用该图片的 PostImage。
+
+原图按块写入存储，写入时逐段去掉 EXIF（包括拍摄位置）、XMP、文本注释等元数据，只保留
+EXIF 方向和颜色配置，不解码像素；因此存储中的原图从写入起就不含元数据。像素数超过
+MAX_IMAGE_PIXELS 的图片在解码前拒绝。
+原图以上传内容的 SHA-256 命名并记录在 image_blobs 表中，重复上传相同内容时直接返回已有地址。
+分享图片记录增删时维护引用数，引用数为0的文件由 gc_image_blobs 命令回收。
+"""
+import atexit
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 衍生图规格：{名称: 最长边像素}
+VARIANTS = {
+    'thumb': 480,   # 列表页缩略图
+    'webp': 1600,   # 详情页大图
+}
+
+WEBP_QUALITY = 80
+
+# 支持上传的原图格式：{格式: 扩展名}
+ORIGINAL_FORMATS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+}
+
+# 去除元数据时每次读取的字节数
+_COPY_CHUNK = 64 * 1024
+
+# 去除元数据时保留的 JPEG APPn 段：{标记: 标识前缀}（JFIF、ICC 颜色配置、Adobe 颜色变换）
+_JPEG_KEPT_APP_SEGMENTS = {
+    0xE0: b'JFIF\0',
+    0xE2: b'ICC_PROFILE\0',
+    0xEE: b'Adobe',
+}
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# 去除元数据时丢弃的 PNG 数据块
+_PNG_METADATA_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+# WebP VP8X 头中的 EXIF、XMP 标志位
+_WEBP_EXIF_FLAG = 0x08
+_WEBP_XMP_FLAG = 0x04
+
+# EXIF 方向为这些值时图片需旋转90度，宽高互换
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Pillow 读取损坏、不支持或像素过多的图片时抛出的异常
+INVALID_IMAGE_ERRORS = (OSError, SyntaxError, ValueError, RuntimeError, Image.DecompressionBombError)
+
+
+
+class ImageTooLarge(ValueError):
+    """图片像素数超过 MAX_IMAGE_PIXELS"""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _max_pixels():
+    """允许上传的最大像素数"""
+    return getattr(settings, 'MAX_IMAGE_PIXELS', 50_000_000)
+
+
+def _workers():
+    """处理衍生图的线程数，为0时在请求线程中同步处理"""
+    return getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+
+
+def variant_path(path, name):
+    """原图存储路径对应的衍生图路径"""
+    return f'{os.path.splitext(path)[0]}_{name}.webp'
+
+
+def variant_url(image_url, name):
+    """原图地址对应的衍生图地址"""
+    parsed = urlparse(image_url)
+    return parsed._replace(path=variant_path(parsed.path, name)).geturl()
+
+
+def storage_path(image_url):
+    """本站上传图片地址对应的存储路径，外部地址返回 None"""
+    path = urlparse(image_url or '').path
+    if not path.startswith(settings.MEDIA_URL):
+        return None
+    return path[len(settings.MEDIA_URL):]
+
+
+def read_dimensions(image_file):
+    """
+    读取图片宽高（按 EXIF 方向换算），同时校验文件确实是支持格式的图片；读取后文件指针回到开头
+
+    只读取文件头，不解码像素；像素数超过 MAX_IMAGE_PIXELS 时抛出 ImageTooLarge。
+    """
+    try:
+        # verify() 必须紧接在 open 之后调用，且调用后图片对象不能再使用，校验后重新打开读取
+        with Image.open(image_file) as image:
+            image.verify()
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            if image.format not in ORIGINAL_FORMATS:
+                raise ValueError(f'不支持的图片格式: {image.format}')
+            width, height = image.size
+            if width * height > _max_pixels():
+                raise ImageTooLarge(f'图片像素数超过上限: {width}x{height}')
+            if image.getexif().get(0x0112) in _ROTATED_ORIENTATIONS:
+                width, height = height, width
+    finally:
+        image_file.seek(0)
+    return width, height
+
+
+def content_hash(image_file):
+    """按块计算文件内容的 SHA-256；计算后文件指针回到开头"""
+    digest = hashlib.sha256()
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+class _ChunkReader:
+    """按块读取文件的输入流，供逐段去除元数据使用"""
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = bytearray()
+
+    def _fill(self, size):
+        while len(self.buffer) < size:
+            data = self.file.read(_COPY_CHUNK)
+            if not data:
+                raise ValueError('图片文件不完整')
+            self.buffer += data
+
+    def read(self, size):
+        self._fill(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def copy(self, out, size):
+        """复制 size 字节到输出"""
+        while size > 0:
+            self._fill(min(size, _COPY_CHUNK))
+            data = self.buffer[:size]
+            out.write(data)
+            del self.buffer[:len(data)]
+            size -= len(data)
+
+    def skip(self, size):
+        self.copy(_DISCARD, size)
+
+    def copy_jpeg_scan(self, out):
+        """复制 JPEG 熵编码数据，停在下一个标记（不含填充字节 0xFF00 和 RSTn）之前"""
+        while True:
+            pos = self.buffer.find(b'\xff')
+            while 0 <= pos < len(self.buffer) - 1:
+                marker = self.buffer[pos + 1]
+                if marker not in (0x00, 0xFF) and not 0xD0 <= marker <= 0xD7:
+                    out.write(self.buffer[:pos])
+                    del self.buffer[:pos]
+                    return
+                pos = self.buffer.find(b'\xff', pos + 1)
+            # 末尾的 0xFF 可能是下一块中标记的前半部分，留到读取下一块后再判断
+            end = len(self.buffer) - 1 if pos >= 0 else len(self.buffer)
+            out.write(self.buffer[:end])
+            del self.buffer[:end]
+            self._fill(len(self.buffer) + 1)
+
+
+class _Discard:
+    def write(self, data):
+        pass
+
+
+_DISCARD = _Discard()
+
+
+def _orientation_exif(orientation):
+    """只包含方向信息的 EXIF（带 Exif 头），无需旋转时返回 None"""
+    if orientation in (None, 1):
+        return None
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return exif.tobytes()
+
+
+def _strip_jpeg(reader, out, exif):
+    """去除 JPEG 中 JFIF、ICC、Adobe 以外的 APPn 段和注释，丢弃 EOI 之后附加的数据"""
+    if reader.read(2) != b'\xff\xd8':
+        raise ValueError('JPEG 文件头无效')
+    out.write(b'\xff\xd8')
+    while True:
+        prefix, marker = reader.read(2)
+        if prefix != 0xFF:
+            raise ValueError('JPEG 标记无效')
+        while marker == 0xFF:
+            marker = reader.read(1)[0]
+        if marker == 0xD9:
+            out.write(b'\xff\xd9')
+            return
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.write(bytes((0xFF, marker)))
+            continue
+
+        length = int.from_bytes(reader.read(2), 'big')
+        if length < 2:
+            raise ValueError('JPEG 段长度无效')
+        payload = reader.read(length - 2)
+        # 方向信息放在 JFIF 段之后、其他段之前
+        if exif is not None and marker != 0xE0:
+            out.write(b'\xff\xe1' + (len(exif) + 2).to_bytes(2, 'big') + exif)
+            exif = None
+        if marker == 0xFE or (0xE0 <= marker <= 0xEF and not payload.startswith(
+                _JPEG_KEPT_APP_SEGMENTS.get(marker, b'\xff'))):
+            continue
+        out.write(bytes((0xFF, marker)) + length.to_bytes(2, 'big') + payload)
+        if marker == 0xDA:
+            reader.copy_jpeg_scan(out)
+
+
+def _strip_png(reader, out, exif):
+    """去除 PNG 中的 EXIF、文本和时间数据块，方向信息写入图像数据之前的 eXIf 块"""
+    if reader.read(8) != _PNG_SIGNATURE:
+        raise ValueError('PNG 文件头无效')
+    out.write(_PNG_SIGNATURE)
+    while True:
+        header = reader.read(8)
+        length, chunk_type = int.from_bytes(header[:4], 'big'), header[4:]
+        if exif is not None and chunk_type in (b'IDAT', b'IEND'):
+            data = exif[6:]  # PNG 的 eXIf 块不带 "Exif\0\0" 前缀
+            out.write(len(data).to_bytes(4, 'big') + b'eXIf' + data)
+            out.write(zlib.crc32(b'eXIf' + data).to_bytes(4, 'big'))
+            exif = None
+        if chunk_type in _PNG_METADATA_CHUNKS:
+            reader.skip(length + 4)
+        else:
+            out.write(header)
+            reader.copy(out, length + 4)
+        if chunk_type == b'IEND':
+            return
+
+
+def _strip_webp(reader, out, exif):
+    """去除 WebP 中的 EXIF、XMP 数据块，方向信息写入文件末尾的 EXIF 块，最后修正 RIFF 长度"""
+    header = reader.read(12)
+    if header[:4] != b'RIFF' or header[8:] != b'WEBP':
+        raise ValueError('WebP 文件头无效')
+    out.write(header)
+    remaining = int.from_bytes(header[4:8], 'little') - 4
+    extended = False
+    while remaining > 0:
+        chunk_header = reader.read(8)
+        size = int.from_bytes(chunk_header[4:], 'little')
+        padded = size + (size & 1)
+        remaining -= 8 + padded
+        fourcc = chunk_header[:4]
+        if fourcc in (b'EXIF', b'XMP '):
+            reader.skip(padded)
+        elif fourcc == b'VP8X':
+            # 只有扩展格式（带 VP8X 头）的 WebP 能携带 EXIF
+            extended = True
+            flags = bytearray(reader.read(padded))
+            flags[0] &= ~(_WEBP_EXIF_FLAG | _WEBP_XMP_FLAG) & 0xFF
+            if exif is not None:
+                flags[0] |= _WEBP_EXIF_FLAG
+            out.write(chunk_header + flags)
+        else:
+            out.write(chunk_header)
+            reader.copy(out, padded)
+    if extended and exif is not None:
+        data = exif[6:]
+        out.write(b'EXIF' + len(data).to_bytes(4, 'little') + data + b'\0' * (len(data) & 1))
+    end = out.tell()
+    out.seek(4)
+    out.write((end - 8).to_bytes(4, 'little'))
+    out.seek(end)
+
+
+_STRIPPERS = {
+    'JPEG': _strip_jpeg,
+    'PNG': _strip_png,
+    'WEBP': _strip_webp,
+}
+
+
+def strip_metadata(image_file):
+    """
+    逐段复制图片并去掉 EXIF（包括拍摄位置）、XMP、文本注释等元数据，只保留 EXIF 方向和颜色配置
+
+    按块读取和写出，不解码像素。返回 (临时文件, 扩展名)，由调用方关闭临时文件；处理后文件指针回到开头。
+    """
+    try:
+        with Image.open(image_file) as image:
+            image_format = image.format
+            orientation = image.getexif().get(0x0112)
+        if image_format not in ORIGINAL_FORMATS:
+            raise ValueError(f'不支持的图片格式: {image_format}')
+
+        image_file.seek(0)
+        out = tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440))
+        try:
+            _STRIPPERS[image_format](_ChunkReader(image_file), out, _orientation_exif(orientation))
+        except Exception:
+            out.close()
+            raise
+    finally:
+        image_file.seek(0)
+    out.seek(0)
+    return File(out), ORIGINAL_FORMATS[image_format]
+
+
+def store_upload(image_file, directory, width, height):
+    """
+    按内容保存上传图片，返回 (ImageBlob, 是否新写入文件)
+
+    内容相同的图片已存在时直接返回已有记录，不再写入文件和生成衍生图。
+    新文件去掉元数据后以上传内容的哈希命名写入存储，再提交衍生图处理任务。
+    """
+    from community.models import ImageBlob
+
+    digest = content_hash(image_file)
+    with transaction.atomic():
+        # 加锁读取，与 gc_image_blobs 互斥：正在回收的记录等回收提交后按新文件处理
+        blob = ImageBlob.objects.select_for_update().filter(sha256=digest).first()
+        if blob is not None and default_storage.exists(blob.path):
+            # 刷新最后上传时间，未被引用的图片重新计算回收宽限期
+            ImageBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+            return blob, False
+
+    content, extension = strip_metadata(image_file)
+    path = blob.path if blob is not None else f'{directory}/{digest}{extension}'
+    with content:
+        size = content.size
+        saved_path = default_storage.save(path, content)
+    try:
+        with transaction.atomic():
+            if blob is None:
+                blob = ImageBlob.objects.create(
+                    sha256=digest, path=saved_path, size=size, width=width, height=height
+                )
+            elif saved_path != blob.path:
+                ImageBlob.objects.filter(pk=blob.pk).update(path=saved_path)
+                blob.path = saved_path
+    except IntegrityError:
+        # 并发上传了相同内容，使用先写入的记录
+        default_storage.delete(saved_path)
+        return ImageBlob.objects.get(sha256=digest), False
+
+    submit(blob.path)
+    return blob, True
+
+
+def variants_exist(path):
+    """衍生图是否都已生成"""
+    return all(default_storage.exists(variant_path(path, name)) for name in VARIANTS)
+
+
+def describe(image_url):
+    """本站上传图片的宽高、衍生图状态和内容索引记录，用于创建图片记录；外部或不存在的图片返回空字典"""
+    from community.models import ImageBlob
+
+    path = storage_path(image_url)
+    if path is None:
+        return {}
+    blob = ImageBlob.objects.filter(path=path).first()
+    if blob is not None:
+        return {
+            'width': blob.width, 'height': blob.height,
+            'variants_ready': variants_exist(path), 'blob': blob,
+        }
+    if not default_storage.exists(path):
+        return {}
+    try:
+        with default_storage.open(path, 'rb') as image_file:
+            width, height = read_dimensions(image_file)
+    except INVALID_IMAGE_ERRORS:
+        return {}
+    return {'width': width, 'height': height, 'variants_ready': variants_exist(path)}
+
+
+def generate_variants(path):
+    """为存储中的原图生成全部衍生图"""
+    with default_storage.open(path, 'rb') as source:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+            for name, max_side in VARIANTS.items():
+                variant = image.copy()
+                variant.thumbnail((max_side, max_side), Image.LANCZOS)
+                buffer = BytesIO()
+                variant.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+                target = variant_path(path, name)
+                if default_storage.exists(target):
+                    default_storage.delete(target)
+                default_storage.save(target, ContentFile(buffer.getvalue()))
+
+
+def _process(path):
+    """生成衍生图并标记已引用该图片的记录"""
+    from community.models import PostImage
+
+    try:
+        generate_variants(path)
+        PostImage.objects.filter(
+            image_url__endswith=settings.MEDIA_URL + path, variants_ready=False
+        ).update(variants_ready=True)
+    except Exception:
+        logger.exception('生成衍生图失败: %s', path)
+    finally:
+        if _workers() > 0:
+            connections.close_all()
+
+
+def submit(path):
+    """提交原图的衍生图处理任务"""
+    global _executor
+
+    if _workers() <= 0:
+        _process(path)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='image-derivatives')
+        executor = _executor
+    executor.submit(_process, path)
+
+
+def shutdown():
+    """等待排队中的处理任务完成（进程退出前调用）"""
+    global _executor
+
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+atexit.register(shutdown)
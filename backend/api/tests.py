@@ -1,3 +1,242 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image, ImageOps
+from rest_framework.test import APITestCase
+
+from community.models import ImageBlob, Post, PostImage
+from community.serializers import PostImageSerializer
+from users.models import User
+from . import images
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=60)
+class WechatUserCacheTests(APITestCase):
+    """认证用户缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(openid='cached_openid', nickname='缓存用户')
+
+    def test_cached_user_skips_user_lookup(self):
+        self.client.get('/api/orders/orders/', HTTP_X_OPENID='cached_openid')
+        with self.assertNumQueries(1):  # 只有订单 COUNT，不再查询用户表
+            response = self.client.get('/api/orders/orders/', HTTP_X_OPENID='cached_openid')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivation_invalidates_cache(self):
+        self.client.get('/api/orders/orders/', HTTP_X_OPENID='cached_openid')
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get('/api/orders/orders/', HTTP_X_OPENID='cached_openid')
+        self.assertEqual(response.data['results'], [])
+
+
+@override_settings(IMAGE_DERIVATIVE_WORKERS=0, WECHAT_USER_CACHE_TTL=0, FEED_CACHE_TTL=0)
+class ImageUploadTests(APITestCase):
+    """图片上传和衍生图生成"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        User.objects.create(openid='uploader', nickname='上传用户')
+
+    def make_jpeg(self):
+        """生成带 EXIF 方向（旋转90度）和拍摄位置的 JPEG"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {2: (30.0, 0.0, 0.0)}
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def make_png(self, size=(64, 48), exif=None):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(buffer, 'PNG', exif=exif or Image.Exif())
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_png(self):
+        response = self.client.post('/api/uploads/images/', {'image': self.make_png()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['width'], response.data['height']), (64, 48))
+        self.assertTrue(response.data['variants_ready'])
+
+        path = images.storage_path(response.data['image_url'])
+        self.assertTrue(path.endswith('.png'))
+        with default_storage.open(path) as original_file:
+            original = Image.open(original_file)
+            self.assertEqual((original.format, original.size), ('PNG', (64, 48)))
+
+    def test_upload_png_with_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {2: (30.0, 0.0, 0.0)}
+        upload = self.make_png(exif=exif)
+        response = self.client.post('/api/uploads/images/', {'image': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['width'], response.data['height']), (48, 64))
+
+        with default_storage.open(images.storage_path(response.data['image_url'])) as original_file:
+            original = Image.open(original_file)
+            self.assertEqual(dict(original.getexif()), {0x0112: 6})
+            upload.seek(0)
+            self.assertEqual(original.tobytes(), Image.open(upload).tobytes())
+
+    def strip(self, data):
+        content, extension = images.strip_metadata(BytesIO(data))
+        with content:
+            return extension, content.read()
+
+    def test_strip_jpeg_segments(self):
+        exif = Image.Exif()
+        exif[0x8825] = {2: (30.0, 0.0, 0.0)}
+        source = Image.effect_noise((300, 200), 64).convert('RGB')
+        for options in ({}, {'progressive': True}, {'restart_marker_blocks': 1}):
+            buffer = BytesIO()
+            source.save(buffer, 'JPEG', exif=exif, comment=b'shot here', xmp=b'<x:xmpmeta/>', **options)
+            data = buffer.getvalue() + b'trailing metadata'
+
+            extension, stripped = self.strip(data)
+            self.assertEqual(extension, '.jpg')
+            for marker in (b'Exif', b'shot here', b'xmpmeta', b'trailing'):
+                self.assertNotIn(marker, stripped)
+            self.assertEqual(Image.open(BytesIO(stripped)).tobytes(), Image.open(BytesIO(data)).tobytes())
+
+    def test_strip_webp_chunks(self):
+        exif = Image.Exif()
+        exif[0x0112] = 3
+        exif[0x8825] = {2: (30.0, 0.0, 0.0)}
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), 'blue').save(buffer, 'WEBP', exif=exif, xmp=b'<x:xmpmeta/>', lossless=True)
+
+        extension, stripped = self.strip(buffer.getvalue())
+        self.assertEqual(extension, '.webp')
+        self.assertNotIn(b'xmpmeta', stripped)
+        self.assertEqual(int.from_bytes(stripped[4:8], 'little'), len(stripped) - 8)
+        image = Image.open(BytesIO(stripped))
+        self.assertEqual(dict(image.getexif()), {0x0112: 3})
+        self.assertEqual(image.tobytes(), Image.open(buffer).tobytes())
+
+    def test_rejects_truncated_jpeg(self):
+        data = self.make_jpeg().read()
+        truncated = SimpleUploadedFile('photo.jpg', data[:len(data) // 2], content_type='image/jpeg')
+        response = self.client.post('/api/uploads/images/', {'image': truncated})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImageBlob.objects.exists())
+
+    @override_settings(MAX_IMAGE_PIXELS=64 * 48 - 1)
+    def test_rejects_too_many_pixels(self):
+        with mock.patch.object(images, 'store_upload') as store_upload:
+            response = self.client.post('/api/uploads/images/', {'image': self.make_png()})
+        self.assertEqual(response.status_code, 400)
+        store_upload.assert_not_called()
+
+    def test_rejects_corrupted_png(self):
+        data = bytearray(self.make_png().read())
+        data[-20] ^= 0xFF  # 破坏最后一个数据块的校验
+        fake = SimpleUploadedFile('photo.png', bytes(data), content_type='image/png')
+        response = self.client.post('/api/uploads/images/', {'image': fake})
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_generates_variants(self):
+        response = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['width'], response.data['height']), (1000, 2000))
+
+        self.assertTrue(response.data['variants_ready'])
+        self.assertTrue(response.data['thumbnail_url'].endswith('_thumb.webp'))
+
+        path = images.storage_path(response.data['image_url'])
+        # 原图只保留 EXIF 方向，去掉了拍摄位置，图像数据原样保留
+        with default_storage.open(path) as original_file:
+            original = Image.open(original_file)
+            self.assertEqual(dict(original.getexif()), {0x0112: 6})
+            self.assertEqual(ImageOps.exif_transpose(original).size, (1000, 2000))
+            self.assertEqual(original.tobytes(), Image.open(self.make_jpeg()).tobytes())
+
+        for name, max_side in images.VARIANTS.items():
+            with default_storage.open(images.variant_path(path, name)) as variant_file:
+                variant = Image.open(variant_file)
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertEqual(variant.size, (max_side // 2, max_side))
+                self.assertEqual(len(variant.getexif()), 0)
+
+        response = self.client.post('/api/community/posts/', {
+            'shop_name': '烧烤店', 'shop_price': 50, 'comment': '好吃',
+            'images': [{'image_url': 'https://bbq.example.com' + settings.MEDIA_URL + path}],
+        }, format='json', HTTP_X_OPENID='uploader')
+        self.assertEqual(response.status_code, 201)
+
+        image = PostImage.objects.get()
+        self.assertTrue(image.variants_ready)
+        self.assertEqual((image.width, image.height), (1000, 2000))
+        data = PostImageSerializer(image).data
+        self.assertTrue(data['thumbnail_url'].endswith('_thumb.webp'))
+
+    def test_pending_variants_are_not_linked(self):
+        with mock.patch.object(images, 'submit'):
+            response = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()})
+        self.assertFalse(response.data['variants_ready'])
+        self.assertNotIn('thumbnail_url', response.data)
+        self.assertNotIn('webp_url', response.data)
+
+    def test_build_variants_keeps_reference_count(self):
+        image_url = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()}).data['image_url']
+        post = Post.objects.create(
+            user=User.objects.get(), shop_name='烧烤店', shop_price=50, comment='好吃'
+        )
+        image = PostImage.objects.create(post=post, image_url=image_url)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 0)
+
+        for _ in range(2):
+            call_command('build_image_variants', all=True, stdout=StringIO())
+            self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        image.refresh_from_db()
+        self.assertEqual(image.blob, ImageBlob.objects.get())
+
+        image.delete()
+        self.assertEqual(ImageBlob.objects.get().ref_count, 0)
+
+    def test_rejects_non_image(self):
+        fake = SimpleUploadedFile('photo.jpg', b'not an image', content_type='image/jpeg')
+        response = self.client.post('/api/uploads/images/', {'image': fake})
+        self.assertEqual(response.status_code, 400)
+
+    def test_duplicate_upload_reuses_file(self):
+        first = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()}).data
+        second = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()}).data
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(first['image_url'], second['image_url'])
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+    def test_reference_count_and_gc(self):
+        image_url = self.client.post('/api/uploads/images/', {'image': self.make_jpeg()}).data['image_url']
+        path = images.storage_path(image_url)
+        post = Post.objects.create(
+            user=User.objects.get(), shop_name='烧烤店', shop_price=50, comment='好吃'
+        )
+        PostImage.objects.create(post=post, image_url=image_url, **images.describe(image_url))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+        call_command('gc_image_blobs', grace_hours=0, stdout=StringIO())
+        self.assertTrue(default_storage.exists(path))
+
+        post.delete()
+        self.assertEqual(ImageBlob.objects.get().ref_count, 0)
+        call_command('gc_image_blobs', grace_hours=0, stdout=StringIO())
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(default_storage.exists(path))
+        self.assertFalse(default_storage.exists(images.variant_path(path, 'thumb')))
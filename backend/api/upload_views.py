@@ -2,12 +2,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.conf import settings
-import uuid
 import os
 from datetime import datetime
+from . import images
 
 
 class ImageUploadView(APIView):
@@ -30,26 +28,42 @@ class ImageUploadView(APIView):
             return Response({'error': '图片大小不能超过2MB'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # 生成唯一文件名
-            file_extension = os.path.splitext(image_file.name)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}{file_extension}"
+            # 读取宽高并校验文件内容确实是图片
+            try:
+                width, height = images.read_dimensions(image_file)
+            except images.ImageTooLarge:
+                return Response({'error': '图片尺寸过大'}, status=status.HTTP_400_BAD_REQUEST)
+            except images.INVALID_IMAGE_ERRORS:
+                return Response({'error': '图片文件已损坏或格式不支持'}, status=status.HTTP_400_BAD_REQUEST)
             
-            # 按日期创建目录
+            # 按内容哈希去重保存（去除元数据后按块写入存储），新文件在线程池中生成缩略图和 WebP 图
             date_path = datetime.now().strftime('%Y/%m/%d')
-            file_path = f"uploads/images/{date_path}/{unique_filename}"
-            
-            # 保存文件
-            saved_path = default_storage.save(file_path, ContentFile(image_file.read()))
+            try:
+                blob, created = images.store_upload(
+                    image_file, f"uploads/images/{date_path}", width, height
+                )
+            except ValueError:
+                # 去除元数据时发现文件结构不完整
+                return Response({'error': '图片文件已损坏或格式不支持'}, status=status.HTTP_400_BAD_REQUEST)
             
             # 构建完整URL
-            image_url = request.build_absolute_uri(settings.MEDIA_URL + saved_path)
-            
-            return Response({
+            image_url = request.build_absolute_uri(settings.MEDIA_URL + blob.path)
+            data = {
                 'image_url': image_url,
-                'image_id': unique_filename.split('.')[0],
+                'image_id': blob.sha256,
+                'width': blob.width,
+                'height': blob.height,
                 'file_size': image_file.size,
-                'file_name': image_file.name
-            }, status=status.HTTP_200_OK)
+                'file_name': image_file.name,
+                'deduplicated': not created,
+                'variants_ready': images.variants_exist(blob.path),
+            }
+            # 衍生图在后台生成，文件写入后才返回其地址
+            if data['variants_ready']:
+                data['thumbnail_url'] = images.variant_url(image_url, 'thumb')
+                data['webp_url'] = images.variant_url(image_url, 'webp')
+            
+            return Response(data, status=status.HTTP_200_OK)
             
         except Exception as e:
             return Response({'error': f'上传失败: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
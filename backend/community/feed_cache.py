@@ -0,0 +1,96 @@
+"""
+社区列表页缓存
+
+未搜索、未按位置筛选的列表页对所有用户相同，序列化后的分页结果按
+排序方式、每页条数、页码/游标缓存。缓存内容不含当前用户相关的字段，
+命中后再合并 is_liked 和 distance。审核通过、拒绝或删除帖子时通过更换
+缓存版本号使全部列表页失效。
+"""
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import geo
+
+# 可缓存的排序方式（小程序使用的最新和热门排序）
+CACHEABLE_ORDERINGS = ['', '-created_at', '-likes_count', '-likes_count,-view_count']
+
+# 链接中与分页位置相关的参数
+PAGE_PARAMS = ['page', 'cursor']
+
+VERSION_KEY = 'community_feed:version'
+
+
+def _timeout():
+    return getattr(settings, 'FEED_CACHE_TTL', 30)
+
+
+def get_cache_key(request):
+    """返回列表页的缓存键，请求不可缓存时返回 None"""
+    params = request.query_params
+    if _timeout() <= 0:
+        return None
+    if params.get('search') or params.get('radius'):
+        return None
+    ordering = params.get('ordering', '')
+    if ordering not in CACHEABLE_ORDERINGS:
+        return None
+
+    version = cache.get_or_set(VERSION_KEY, time.time_ns(), None)
+    parts = [params.get(name, '') for name in ('page_size', 'page', 'cursor', 'pagination')]
+    return ':'.join(['community_feed', str(version), ordering, *parts])
+
+
+def get_page(cache_key):
+    return cache.get(cache_key)
+
+
+def set_page(cache_key, payload):
+    cache.set(cache_key, payload, _timeout())
+
+
+def invalidate():
+    """使全部列表页缓存失效"""
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def personalize(payload, request):
+    """为缓存的分页结果合并当前用户的点赞状态和距离，并按当前请求重建翻页链接"""
+    from .serializers import get_liked_post_ids
+
+    results = [dict(post) for post in payload['results']]
+    liked_post_ids = get_liked_post_ids(request, [post['id'] for post in results])
+    user_lat = request.query_params.get('lat')
+    user_lng = request.query_params.get('lng')
+
+    for post in results:
+        post['is_liked'] = post['id'] in liked_post_ids
+        post['distance'] = None
+        if user_lat and user_lng and post['latitude'] and post['longitude']:
+            try:
+                post['distance'] = round(
+                    geo.haversine(*geo.parse_point(user_lat, user_lng), post['latitude'], post['longitude']), 2
+                )
+            except (TypeError, ValueError):
+                pass
+
+    data = dict(payload, results=results)
+    for name in ('next', 'previous'):
+        if data.get(name):
+            data[name] = _rebase_link(data[name], request)
+    return data
+
+
+def _rebase_link(link, request):
+    """把缓存中的翻页位置套用到当前请求的 URL 上"""
+    params = parse_qs(urlparse(link).query)
+    url = request.build_absolute_uri()
+    for name in PAGE_PARAMS:
+        if name in params:
+            url = replace_query_param(url, name, params[name][0])
+        else:
+            url = remove_query_param(url, name)
+    return url
@@ -0,0 +1,319 @@
+"""
+地理位置工具：Geohash 网格编码、附近查询的网格覆盖计算和按距离排序的最近邻查询
+
+帖子保存时会把经纬度编码为 geohash 存入 Post.geohash，附近查询先算出与查询半径
+相交的少量网格单元，再按 geohash 前缀过滤，从而走 (status, geohash) 索引，
+避免经纬度组合索引只能用到前导列的问题。
+"""
+import math
+
+from django.db.models import ExpressionWrapper, FloatField, Q, Value, prefetch_related_objects
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+# geohash 使用的 base32 字符表
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 存储精度：9 位约 4.8m x 4.8m
+GEOHASH_PRECISION = 9
+
+# 单次查询最多使用的网格单元数（每个单元对应一个索引范围扫描）
+MAX_COVER_CELLS = 16
+
+# 计算覆盖时最多枚举的网格数，防止半径过大时枚举过细的网格
+MAX_ENUMERATED_CELLS = 4096
+
+EARTH_RADIUS_KM = 6371
+# 与 haversine 使用同一地球半径，否则外接矩形会比查询半径略小而漏掉边界附近的点
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# 计算外接矩形时半径的放大比例，避免浮点误差漏掉恰好落在边界上的点
+_BBOX_PADDING = 1 + 1e-9
+
+# 最近邻查询第一圈圆环的宽度（公里），之后每圈扩大为上一圈的4倍
+INITIAL_RING_KM = 1
+# 地球表面两点间的最大距离（公里）
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def parse_point(latitude, longitude):
+    """解析请求中的经纬度，返回 (纬度, 经度)；不是有限数值或超出范围时抛出 ValueError"""
+    latitude, longitude = float(latitude), float(longitude)
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        raise ValueError('经纬度必须是有限数值')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('经纬度超出范围')
+    return latitude, longitude
+
+
+def parse_radius(radius_km):
+    """解析请求中的半径（公里）；不是正的有限数值时抛出 ValueError"""
+    radius_km = float(radius_km)
+    if not math.isfinite(radius_km) or radius_km <= 0:
+        raise ValueError('半径必须是正数')
+    return radius_km
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """将经纬度编码为 geohash"""
+    latitude, longitude = float(latitude), float(longitude)
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # 偶数位编码经度，奇数位编码纬度
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lng_lo = mid
+            else:
+                bits = bits * 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_lo = mid
+            else:
+                bits = bits * 2
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def decode_bbox(geohash):
+    """解码 geohash，返回网格范围 (lat_min, lat_max, lng_min, lng_max)"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def cell_size(precision):
+    """返回指定精度下单个网格的 (纬度跨度, 经度跨度)，单位为度"""
+    lat_bits = 5 * precision // 2
+    lng_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """计算两点之间的球面距离（公里）"""
+    lat1, lng1, lat2, lng2 = float(lat1), float(lng1), float(lat2), float(lng2)
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlng / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    计算圆形范围的外接经纬度矩形 (lat_min, lat_max, lng_min, lng_max)
+
+    跨越180度经线时经度范围会超出 [-180, 180]，由 longitude_ranges 拆分为两段。
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    angle = radius_km * _BBOX_PADDING / EARTH_RADIUS_KM
+    lat_range = math.degrees(angle)
+    lat_min = latitude - lat_range
+    lat_max = latitude + lat_range
+
+    # 范围包含极点时覆盖全部经度
+    if lat_min <= -90 or lat_max >= 90:
+        return max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0
+
+    # 球面上圆的最大经度偏移，高纬度时比“半径 / 纬线每度长度”更大
+    lng_range = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(latitude)), 1.0)))
+    return lat_min, lat_max, longitude - lng_range, longitude + lng_range
+
+
+def longitude_ranges(lng_min, lng_max):
+    """将外接矩形的经度范围拆分为 [-180, 180] 内的区间列表（跨越180度经线时为两段）"""
+    if lng_max - lng_min >= 360:
+        return [(-180.0, 180.0)]
+    if lng_min < -180:
+        return [(lng_min + 360, 180.0), (-180.0, lng_max)]
+    if lng_max > 180:
+        return [(lng_min, 180.0), (-180.0, lng_max - 360)]
+    return [(lng_min, lng_max)]
+
+
+def _grid_indexes(low, high, origin, step, count):
+    """计算区间 [low, high] 覆盖的网格下标范围"""
+    first = min(int((low - origin) // step), count - 1)
+    last = min(int((high - origin) // step), count - 1)
+    return range(max(first, 0), max(last, 0) + 1)
+
+
+def _max_distance(latitude, longitude, cell):
+    """网格内任意点到指定点距离的上界（公里）"""
+    lat_min, lat_max, lng_min, lng_max = decode_bbox(cell)
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    half_diagonal = max(
+        haversine(center_lat, center_lng, lat, lng)
+        for lat in (lat_min, lat_max) for lng in (lng_min, lng_max)
+    )
+    return haversine(latitude, longitude, center_lat, center_lng) + half_diagonal
+
+
+def cover(latitude, longitude, radius_km, inner_km=0, max_cells=MAX_COVER_CELLS):
+    """
+    计算与查询范围相交的网格单元列表
+
+    在不超过 max_cells 个单元的前提下选择尽可能细的精度。
+    inner_km 大于0时查询范围为圆环，完全落在内圆里的单元会被剔除。
+    """
+    lat_min, lat_max, lng_min, lng_max = bounding_box(latitude, longitude, radius_km)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lng_step = cell_size(precision)
+        lat_rows = _grid_indexes(lat_min, lat_max, -90.0, lat_step, round(180.0 / lat_step))
+        lng_cols = sorted({
+            col
+            for low, high in longitude_ranges(lng_min, lng_max)
+            for col in _grid_indexes(low, high, -180.0, lng_step, round(360.0 / lng_step))
+        })
+        grid_count = len(lat_rows) * len(lng_cols)
+
+        if grid_count > MAX_ENUMERATED_CELLS:
+            continue
+        if inner_km <= 0 and grid_count > max_cells and precision > 1:
+            continue
+
+        cells = []
+        for row in lat_rows:
+            for col in lng_cols:
+                cell = encode(
+                    -90.0 + (row + 0.5) * lat_step,
+                    -180.0 + (col + 0.5) * lng_step,
+                    precision
+                )
+                if inner_km > 0 and _max_distance(latitude, longitude, cell) < inner_km:
+                    continue
+                cells.append(cell)
+
+        if len(cells) <= max_cells or precision == 1:
+            return cells
+
+    return []
+
+
+def cells_q(cells, field='geohash'):
+    """
+    将网格单元列表转换为 geohash 前缀查询条件
+
+    使用 LIKE 前缀匹配而不是 >= / < 范围比较：MySQL 的 utf8mb4_unicode_ci 排序规则下
+    标点符号排在字母数字之前，无法用某个字符构造前缀的上界。
+    """
+    condition = Q()
+    for cell in cells:
+        condition |= Q(**{f'{field}__startswith': cell})
+    return condition
+
+
+def distance_expression(latitude, longitude):
+    """构造计算帖子到指定点球面距离（公里）的数据库表达式，SQLite 和 MySQL 均可使用"""
+    lat_rad = math.radians(float(latitude))
+    lng_rad = math.radians(float(longitude))
+    row_lat = Radians(Cast('latitude', FloatField()))
+    row_lng = Radians(Cast('longitude', FloatField()))
+    a = (
+        Power(Sin((row_lat - Value(lat_rad)) / Value(2.0)), 2) +
+        Value(math.cos(lat_rad)) * Cos(row_lat) *
+        Power(Sin((row_lng - Value(lng_rad)) / Value(2.0)), 2)
+    )
+    return ExpressionWrapper(
+        Value(2.0 * EARTH_RADIUS_KM) * ASin(Sqrt(a)),
+        output_field=FloatField()
+    )
+
+
+def within_radius(queryset, latitude, longitude, radius_km, inner_km=0):
+    """
+    精确筛选半径范围内的帖子，结果带有 distance 注解（公里）
+
+    先用网格覆盖和外接矩形缩小候选范围，只对候选记录计算球面距离。
+    inner_km 大于0时剔除完全落在内圆里的网格。
+    """
+    queryset = queryset.annotate(distance=distance_expression(latitude, longitude))
+    cells = cover(latitude, longitude, radius_km, inner_km=inner_km)
+    if not cells:
+        return queryset.none()
+
+    lat_min, lat_max, lng_min, lng_max = bounding_box(latitude, longitude, radius_km)
+    longitude_q = Q()
+    for low, high in longitude_ranges(lng_min, lng_max):
+        longitude_q |= Q(longitude__range=[low, high])
+    return queryset.filter(
+        cells_q(cells),
+        longitude_q,
+        latitude__range=[lat_min, lat_max],
+        distance__lte=radius_km,
+    )
+
+
+def nearest(queryset, latitude, longitude, limit, after=None, max_km=None):
+    """
+    按距离由近到远返回前 limit 条帖子，每条带有 distance 属性（公里）
+
+    从起始距离开始按圆环向外扩展搜索，凑够 limit 条或搜索范围达到 max_km 后停止，
+    只对圆环内的候选记录排序。after 为上一页最后一条的 (distance, id)，
+    传入后从该位置继续查找，因此深层分页与第一页开销相同。
+    """
+    max_km = min(max_km or MAX_DISTANCE_KM, MAX_DISTANCE_KM)
+    inner, after_id = after if after else (0.0, None)
+    ring = INITIAL_RING_KM
+
+    # 预取关联对象只对最终结果执行一次，不随每圈查询重复执行
+    prefetch_lookups = queryset._prefetch_related_lookups
+    queryset = queryset.prefetch_related(None)
+
+    while True:
+        outer = min(inner + ring, max_km)
+        if outer >= MAX_DISTANCE_KM:
+            candidates = queryset.filter(geohash__isnull=False).annotate(
+                distance=distance_expression(latitude, longitude)
+            )
+        else:
+            candidates = within_radius(queryset, latitude, longitude, outer, inner_km=inner)
+
+        if after:
+            candidates = candidates.filter(
+                Q(distance__gt=inner) | Q(distance=inner, id__gt=after_id)
+            )
+
+        results = list(candidates.order_by('distance', 'id')[:limit])
+        if len(results) >= limit or outer >= max_km:
+            prefetch_related_objects(results, *prefetch_lookups)
+            return results
+        ring *= 4
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from api import images
+from community.models import PostImage
+
+
+class Command(BaseCommand):
+    help = '为已有的分享图片生成缩略图和 WebP 图，并记录图片宽高'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='重新生成所有图片的衍生图（默认只处理尚未生成的图片）',
+        )
+
+    def handle(self, *args, **options):
+        queryset = PostImage.objects.only('id', 'image_url', 'blob').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(variants_ready=False)
+
+        done_count = 0
+        skipped_count = 0
+        for image in queryset.iterator(chunk_size=500):
+            path = images.storage_path(image.image_url)
+            if path is None:
+                skipped_count += 1
+                continue
+            try:
+                images.generate_variants(path)
+            except images.INVALID_IMAGE_ERRORS as e:
+                self.stdout.write(self.style.WARNING(f'- ID: {image.id} 处理失败: {e}'))
+                skipped_count += 1
+                continue
+            # 通过 save() 关联图片文件，由信号维护引用数
+            info = images.describe(image.image_url)
+            for field, value in info.items():
+                setattr(image, field, value)
+            if info:
+                image.save(update_fields=list(info))
+            done_count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'成功处理 {done_count} 张图片，跳过 {skipped_count} 张')
+        )
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import images
+from community.models import ImageBlob, PostImage
+
+
+class Command(BaseCommand):
+    help = '回收没有分享引用的图片文件（包括缩略图和 WebP 图）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='仅显示将被回收的文件，不实际删除',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='上传后多少小时内未被分享引用的文件不回收 (默认: 24)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每批处理的文件数量 (默认: 500)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+
+        candidate_ids = list(
+            ImageBlob.objects.filter(
+                ref_count__lte=0, updated_at__lt=cutoff
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+        removed_count = 0
+        removed_bytes = 0
+        for start in range(0, len(candidate_ids), batch_size):
+            batch = candidate_ids[start:start + batch_size]
+            with transaction.atomic():
+                # 加锁后重新确认：期间可能有新上传或新分享引用了这些文件
+                blobs = list(
+                    ImageBlob.objects.select_for_update().filter(
+                        id__in=batch, ref_count__lte=0, updated_at__lt=cutoff
+                    )
+                )
+                referenced = set(
+                    PostImage.objects.filter(blob__in=blobs).values_list('blob_id', flat=True)
+                )
+                blobs = [blob for blob in blobs if blob.id not in referenced]
+                if not dry_run:
+                    ImageBlob.objects.filter(id__in=[blob.id for blob in blobs]).delete()
+
+                # 持有行锁时删除文件：重复上传相同内容需等待回收提交，之后按新文件重新写入。
+                # 删除文件后事务回滚时记录仍在而文件已不存在，下次上传会重新写入文件
+                for blob in blobs:
+                    self.stdout.write(f'- {blob.path} ({blob.size} 字节)')
+                    if not dry_run:
+                        self._delete_files(blob.path)
+                    removed_count += 1
+                    removed_bytes += blob.size
+
+        if removed_count == 0:
+            self.stdout.write(self.style.SUCCESS('没有需要回收的图片文件'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'找到 {removed_count} 个可回收的图片文件，共 {removed_bytes} 字节（预览模式，未删除）'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'成功回收 {removed_count} 个图片文件，释放 {removed_bytes} 字节'
+            ))
+
+    def _delete_files(self, path):
+        for name in [path, *(images.variant_path(path, variant) for variant in images.VARIANTS)]:
+            if default_storage.exists(name):
+                default_storage.delete(name)
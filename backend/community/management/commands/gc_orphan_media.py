@@ -0,0 +1,158 @@
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import images
+from community.models import ImageBlob, PostImage
+
+UPLOAD_DIR = 'uploads/images'
+
+
+class Command(BaseCommand):
+    help = '清理上传目录中没有分享图片引用的文件（已删除分享的图片、上传后未发布的图片）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='仅统计将被清理的文件，不实际删除',
+        )
+        parser.add_argument(
+            '--quarantine',
+            type=str,
+            help='将孤立文件移动到该目录（保留原有目录结构），而不是直接删除',
+        )
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=24,
+            help='最近多少小时内修改的文件不清理，避免误删刚上传还未发布的图片 (默认: 24)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='并行扫描的日期目录数 (默认: 4)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='读取图片引用时每批的记录数 (默认: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.quarantine = options['quarantine']
+        self.cutoff = time.time() - options['grace_hours'] * 3600
+        self.media_root = str(settings.MEDIA_ROOT)
+
+        if self.quarantine:
+            self.quarantine = os.path.abspath(self.quarantine)
+            if self.quarantine.startswith(os.path.abspath(self.media_root) + os.sep):
+                raise CommandError('隔离目录不能位于 MEDIA_ROOT 内')
+
+        started = time.monotonic()
+        self.referenced = self._referenced_stems(options['batch_size'])
+        self.stdout.write(f'已加载 {len(self.referenced)} 个被引用的图片')
+
+        day_dirs = self._day_dirs(os.path.join(self.media_root, UPLOAD_DIR))
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            results = list(executor.map(self._sweep_dir, day_dirs))
+
+        scanned = sum(result['scanned'] for result in results)
+        orphans = sum(result['orphans'] for result in results)
+        orphan_bytes = sum(result['bytes'] for result in results)
+        errors = [error for result in results for error in result['errors']]
+        elapsed = time.monotonic() - started
+
+        for error in errors:
+            self.stdout.write(self.style.WARNING(f'- {error}'))
+
+        self.stdout.write(
+            f'扫描 {len(day_dirs)} 个日期目录、{scanned} 个文件，耗时 {elapsed:.2f} 秒'
+            f'（{scanned / elapsed if elapsed else scanned:.0f} 个文件/秒）'
+        )
+        if orphans == 0:
+            self.stdout.write(self.style.SUCCESS('没有需要清理的孤立文件'))
+        elif self.dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'找到 {orphans} 个孤立文件，共 {orphan_bytes} 字节（预览模式，未修改）'
+            ))
+        else:
+            verb = '隔离' if self.quarantine else '删除'
+            self.stdout.write(self.style.SUCCESS(
+                f'成功{verb} {orphans - len(errors)} 个孤立文件，共 {orphan_bytes} 字节'
+            ))
+
+    def _referenced_stems(self, batch_size):
+        """分批读取被引用的图片路径，返回去掉扩展名的路径集合（衍生图按原图判断）"""
+        stems = set()
+        urls = PostImage.objects.values_list('image_url', flat=True).order_by()
+        for image_url in urls.iterator(chunk_size=batch_size):
+            path = images.storage_path(image_url)
+            if path is not None:
+                stems.add(os.path.splitext(path)[0])
+
+        # 内容索引中的文件由 gc_image_blobs 按引用数回收
+        paths = ImageBlob.objects.values_list('path', flat=True).order_by()
+        for path in paths.iterator(chunk_size=batch_size):
+            stems.add(os.path.splitext(path)[0])
+        return stems
+
+    def _day_dirs(self, root):
+        """列出 YYYY/MM/DD 日期目录"""
+        directories = [root] if os.path.isdir(root) else []
+        for _ in range(3):
+            directories = [
+                entry.path
+                for directory in directories
+                for entry in os.scandir(directory) if entry.is_dir(follow_symlinks=False)
+            ]
+        return sorted(directories)
+
+    def _stem(self, relative_path):
+        """文件对应的原图路径（不含扩展名）"""
+        stem = os.path.splitext(relative_path)[0]
+        for name in images.VARIANTS:
+            if stem.endswith(f'_{name}'):
+                return stem[:-len(name) - 1]
+        return stem
+
+    def _sweep_dir(self, directory):
+        """扫描一个日期目录，删除或隔离其中的孤立文件"""
+        result = {'scanned': 0, 'orphans': 0, 'bytes': 0, 'errors': []}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                result['scanned'] += 1
+
+                relative_path = os.path.relpath(entry.path, self.media_root).replace(os.sep, '/')
+                if self._stem(relative_path) in self.referenced:
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > self.cutoff:
+                    continue
+
+                result['orphans'] += 1
+                result['bytes'] += stat.st_size
+                if self.dry_run:
+                    continue
+                try:
+                    self._remove(entry.path, relative_path)
+                except OSError as e:
+                    result['errors'].append(f'{relative_path}: {e}')
+        return result
+
+    def _remove(self, path, relative_path):
+        if not self.quarantine:
+            os.remove(path)
+            return
+        target = os.path.join(self.quarantine, relative_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
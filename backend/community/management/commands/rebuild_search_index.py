@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from community.models import Post, PostSearchToken
+from community.search import build_tokens, FIELD_WEIGHTS
+
+
+class Command(BaseCommand):
+    help = '重建帖子检索倒排索引（用于批量更新或导入数据后）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每批处理的帖子数量 (默认: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.only('id', *FIELD_WEIGHTS).order_by('id')
+
+        post_count = 0
+        token_count = 0
+        batch = []
+        for post in posts.iterator(chunk_size=batch_size):
+            batch.append(post)
+            if len(batch) >= batch_size:
+                token_count += self._index(batch)
+                post_count += len(batch)
+                batch = []
+        if batch:
+            token_count += self._index(batch)
+            post_count += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'成功为 {post_count} 个帖子建立 {token_count} 条索引记录')
+        )
+
+    def _index(self, posts):
+        tokens = [
+            PostSearchToken(post=post, token=token, weight=weight)
+            for post in posts
+            for token, weight in build_tokens(post).items()
+        ]
+        with transaction.atomic():
+            PostSearchToken.objects.filter(post__in=posts).delete()
+            PostSearchToken.objects.bulk_create(tokens)
+        return len(tokens)
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from community.models import Post, PostLike
+
+
+class Command(BaseCommand):
+    help = '根据点赞表批量修正帖子的点赞数'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='仅显示点赞数不一致的帖子，不实际修改',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='每批更新的帖子数量 (默认: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        # 一次分组统计找出点赞数与点赞表不一致的帖子
+        drifted_posts = Post.objects.annotate(
+            actual_likes=Count('postlike')
+        ).exclude(
+            likes_count=F('actual_likes')
+        ).only('id', 'shop_name', 'likes_count').order_by('id')
+
+        batch = []
+        fixed_count = 0
+        for post in drifted_posts.iterator(chunk_size=batch_size):
+            self.stdout.write(
+                f'- ID: {post.id}, 店铺: {post.shop_name}, '
+                f'记录点赞数: {post.likes_count}, 实际点赞数: {post.actual_likes}'
+            )
+            batch.append(post.id)
+            if len(batch) >= batch_size:
+                fixed_count += self._save(batch, dry_run)
+                batch = []
+        if batch:
+            fixed_count += self._save(batch, dry_run)
+
+        if fixed_count == 0:
+            self.stdout.write(self.style.SUCCESS('所有帖子的点赞数均正确'))
+        elif dry_run:
+            self.stdout.write(
+                self.style.WARNING(f'找到 {fixed_count} 个点赞数不一致的帖子（预览模式，未修改）')
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f'成功修正 {fixed_count} 个帖子的点赞数'))
+
+    def _save(self, post_ids, dry_run):
+        if not dry_run:
+            # 在 UPDATE 语句中重新统计点赞数，不写回之前读到的值，
+            # 避免覆盖读取之后点赞切换用 F() 做的增减
+            actual_likes = PostLike.objects.filter(
+                post=OuterRef('pk')
+            ).order_by().values('post').annotate(total=Count('id')).values('total')
+            Post.objects.filter(id__in=post_ids).update(
+                likes_count=Coalesce(Subquery(actual_likes), 0)
+            )
+        return len(post_ids)
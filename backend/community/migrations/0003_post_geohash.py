@@ -0,0 +1,86 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+# 迁移中使用冻结的编码函数，不依赖之后可能变化的 community.geo
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """将经纬度编码为 geohash"""
+    latitude, longitude = float(latitude), float(longitude)
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # 偶数位编码经度，奇数位编码纬度
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lng_lo = mid
+            else:
+                bits = bits * 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_lo = mid
+            else:
+                bits = bits * 2
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    """为已有帖子计算地理网格编码"""
+    Post = apps.get_model("community", "Post")
+    posts = Post.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).only("id", "latitude", "longitude")
+
+    batch = []
+    for post in posts.iterator(chunk_size=1000):
+        post.geohash = encode(post.latitude, post.longitude)
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0002_remove_shop_location"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="geohash",
+            field=models.CharField(
+                blank=True, max_length=12, null=True, verbose_name="地理网格编码"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["status", "geohash"], name="posts_status_f1029b_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:17
+
+import django.db.models.deletion
+import re
+from collections import Counter
+
+from django.db import migrations, models
+
+# 迁移中使用冻结的切分规则，不依赖之后可能变化的 community.search
+FIELD_WEIGHTS = {
+    "shop_name": 3,
+    "comment": 1,
+    "location_address": 1,
+}
+MAX_TOKEN_LENGTH = 32
+MIN_PREFIX_LENGTH = 2
+TOKEN_RE = re.compile(r"[\u4e00-\u9fff\u3400-\u4dbf]+|[a-z0-9]+")
+
+
+def tokenize(text):
+    """中文切分为单字和二元组，英文和数字切分为各个前缀"""
+    tokens = []
+    for run in TOKEN_RE.findall((text or "").lower()):
+        if "\u4e00" <= run[0] <= "\u9fff" or "\u3400" <= run[0] <= "\u4dbf":
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            word = run[:MAX_TOKEN_LENGTH]
+            tokens.extend(word[:length] for length in range(MIN_PREFIX_LENGTH, len(word) + 1))
+    return tokens
+
+
+def build_tokens(post):
+    """计算帖子的 {词元: 权重}"""
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(post, field)):
+            weights[token] += weight
+    return weights
+
+
+def build_search_index(apps, schema_editor):
+    """为已有帖子建立检索索引"""
+    Post = apps.get_model("community", "Post")
+    PostSearchToken = apps.get_model("community", "PostSearchToken")
+    posts = Post.objects.only("id", *FIELD_WEIGHTS)
+
+    batch = []
+    for post in posts.iterator(chunk_size=500):
+        batch.extend(
+            PostSearchToken(post_id=post.id, token=token, weight=weight)
+            for token, weight in build_tokens(post).items()
+        )
+        if len(batch) >= 5000:
+            PostSearchToken.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PostSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("community", "0003_post_geohash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostSearchToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.CharField(max_length=32, verbose_name="词元")),
+                ("weight", models.IntegerField(default=1, verbose_name="权重")),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_tokens",
+                        to="community.post",
+                        verbose_name="分享",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "分享检索词元",
+                "verbose_name_plural": "分享检索词元",
+                "db_table": "post_search_tokens",
+                "indexes": [
+                    models.Index(
+                        fields=["token", "post"], name="post_search_token_03452e_idx"
+                    )
+                ],
+                "unique_together": {("post", "token")},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
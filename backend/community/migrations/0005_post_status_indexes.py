@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0004_post_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'created_at'], name='posts_status_def373_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'likes_count'], name='posts_status_949f44_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0005_post_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postimage',
+            name='height',
+            field=models.IntegerField(blank=True, null=True, verbose_name='高度'),
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='variants_ready',
+            field=models.BooleanField(default=False, verbose_name='衍生图已生成'),
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='width',
+            field=models.IntegerField(blank=True, null=True, verbose_name='宽度'),
+        ),
+    ]
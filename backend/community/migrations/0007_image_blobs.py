@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0006_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='内容哈希')),
+                ('path', models.CharField(max_length=255, unique=True, verbose_name='存储路径')),
+                ('size', models.IntegerField(default=0, verbose_name='文件大小')),
+                ('width', models.IntegerField(blank=True, null=True, verbose_name='宽度')),
+                ('height', models.IntegerField(blank=True, null=True, verbose_name='高度')),
+                ('ref_count', models.IntegerField(default=0, verbose_name='引用数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='最后上传时间')),
+            ],
+            options={
+                'verbose_name': '图片文件',
+                'verbose_name_plural': '图片文件',
+                'db_table': 'image_blobs',
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='image_blobs_ref_cou_203800_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='postimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='images', to='community.imageblob', verbose_name='图片文件'),
+        ),
+    ]
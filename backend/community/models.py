@@ -1,6 +1,19 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.core.validators import MaxValueValidator
 from users.models import User
+from . import geo, search
+from .view_counter import view_count_buffer
+
+
+class PostQuerySet(models.QuerySet):
+    """分享查询集"""
+
+    def for_feed(self):
+        """预加载列表展示所需的发布者和图片，避免逐条查询"""
+        return self.select_related('user').prefetch_related(
+            models.Prefetch('images', queryset=PostImage.objects.order_by('sort_order', 'id'))
+        )
 
 
 class Post(models.Model):
@@ -18,12 +31,15 @@ class Post(models.Model):
     latitude = models.DecimalField(max_digits=10, decimal_places=8, blank=True, null=True, verbose_name='纬度')
     longitude = models.DecimalField(max_digits=11, decimal_places=8, blank=True, null=True, verbose_name='经度')
     location_address = models.CharField(max_length=300, blank=True, null=True, verbose_name='位置地址')
+    geohash = models.CharField(max_length=12, blank=True, null=True, verbose_name='地理网格编码')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True, verbose_name='审核状态')
     likes_count = models.IntegerField(default=0, db_index=True, verbose_name='点赞数')
     view_count = models.IntegerField(default=0, verbose_name='查看数')
     created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         db_table = 'posts'
         verbose_name = '社区分享'
@@ -34,15 +50,76 @@ class Post(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['likes_count']),
             models.Index(fields=['latitude', 'longitude']),
+            models.Index(fields=['status', 'geohash']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'likes_count']),
         ]
 
     def __str__(self):
         return f'{self.shop_name} - {self.user.nickname}'
 
+    def save(self, *args, **kwargs):
+        """保存时根据经纬度同步地理网格编码"""
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+
+        # 检索字段有变化时同步重建倒排索引
+        reindex = (
+            (update_fields is None or set(search.FIELD_WEIGHTS) & set(update_fields))
+            and (self._state.adding or self._search_text() != getattr(self, '_indexed_text', None))
+        )
+        if reindex:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                search.index_post(self)
+        else:
+            super().save(*args, **kwargs)
+        self._indexed_text = self._search_text()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """记录加载时的检索字段，保存时据此判断是否需要重建索引"""
+        instance = super().from_db(db, field_names, values)
+        instance._indexed_text = instance._search_text()
+        return instance
+
+    def _search_text(self):
+        """当前已加载的检索字段取值（未加载的延迟字段为 None）"""
+        return tuple(self.__dict__.get(field) for field in search.FIELD_WEIGHTS)
+
     def increment_view_count(self):
-        """增加查看数"""
+        """增加查看数（写入缓冲区，由后台线程批量写回数据库）"""
+        view_count_buffer.add(self.id)
         self.view_count += 1
-        self.save(update_fields=['view_count'])
+
+
+class ImageBlob(models.Model):
+    """上传图片内容索引表：按 SHA-256 去重，ref_count 为引用该文件的分享图片数"""
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='内容哈希')
+    path = models.CharField(max_length=255, unique=True, verbose_name='存储路径')
+    size = models.IntegerField(default=0, verbose_name='文件大小')
+    width = models.IntegerField(blank=True, null=True, verbose_name='宽度')
+    height = models.IntegerField(blank=True, null=True, verbose_name='高度')
+    ref_count = models.IntegerField(default=0, verbose_name='引用数')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='最后上传时间')
+
+    class Meta:
+        db_table = 'image_blobs'
+        verbose_name = '图片文件'
+        verbose_name_plural = '图片文件'
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return self.path
 
 
 class PostImage(models.Model):
@@ -50,6 +127,13 @@ class PostImage(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='images', db_index=True, verbose_name='分享')
     image_url = models.URLField(max_length=500, verbose_name='图片地址')
     sort_order = models.IntegerField(default=0, db_index=True, verbose_name='排序顺序')
+    width = models.IntegerField(blank=True, null=True, verbose_name='宽度')
+    height = models.IntegerField(blank=True, null=True, verbose_name='高度')
+    variants_ready = models.BooleanField(default=False, verbose_name='衍生图已生成')
+    blob = models.ForeignKey(
+        ImageBlob, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='images', verbose_name='图片文件'
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
 
     class Meta:
@@ -62,9 +146,18 @@ class PostImage(models.Model):
         ]
         ordering = ['sort_order']
 
+    # 从数据库加载时引用的图片文件，保存时据此调整引用数（见 signals.py）
+    _loaded_blob_id = None
+
     def __str__(self):
         return f'{self.post.shop_name} - 图片{self.sort_order}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_blob_id = instance.__dict__.get('blob_id')
+        return instance
+
 
 class PostLike(models.Model):
     """点赞表"""
@@ -87,16 +180,63 @@ class PostLike(models.Model):
         return f'{self.user.nickname} 点赞 {self.post.shop_name}'
 
     def save(self, *args, **kwargs):
-        """保存时更新分享的点赞数"""
-        super().save(*args, **kwargs)
-        # 更新分享的点赞数
-        self.post.likes_count = PostLike.objects.filter(post=self.post).count()
-        self.post.save(update_fields=['likes_count'])
+        """新增点赞时原子地增加分享的点赞数"""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Post.objects.filter(pk=self.post_id).update(likes_count=F('likes_count') + 1)
 
     def delete(self, *args, **kwargs):
-        """删除时更新分享的点赞数"""
-        post = self.post
-        super().delete(*args, **kwargs)
-        # 更新分享的点赞数
-        post.likes_count = PostLike.objects.filter(post=post).count()
-        post.save(update_fields=['likes_count'])
+        """删除时原子地减少分享的点赞数"""
+        with transaction.atomic():
+            post_id = self.post_id
+            result = super().delete(*args, **kwargs)
+            if result[0]:
+                Post.objects.filter(pk=post_id).update(likes_count=F('likes_count') - 1)
+        return result
+
+    @classmethod
+    def toggle(cls, post, user):
+        """
+        点赞/取消点赞，返回 (是否已点赞, 最新点赞数)
+
+        在一个事务中执行一次条件删除或插入，再用 F() 表达式增减点赞数，不做 COUNT 统计。
+        """
+        with transaction.atomic():
+            deleted, _ = cls.objects.filter(post=post, user=user).delete()
+            if deleted:
+                is_liked, delta = False, -1
+            else:
+                try:
+                    with transaction.atomic():
+                        cls.objects.bulk_create([cls(post=post, user=user)])
+                    is_liked, delta = True, 1
+                except IntegrityError:
+                    # 并发请求已经点过赞
+                    is_liked, delta = True, 0
+
+            if delta:
+                Post.objects.filter(pk=post.pk).update(likes_count=F('likes_count') + delta)
+            likes_count = Post.objects.filter(pk=post.pk).values_list('likes_count', flat=True).first()
+
+        return is_liked, likes_count
+
+
+class PostSearchToken(models.Model):
+    """分享检索词元表（倒排索引）"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_tokens', verbose_name='分享')
+    token = models.CharField(max_length=32, verbose_name='词元')
+    weight = models.IntegerField(default=1, verbose_name='权重')
+
+    class Meta:
+        db_table = 'post_search_tokens'
+        verbose_name = '分享检索词元'
+        verbose_name_plural = '分享检索词元'
+        unique_together = [['post', 'token']]
+        indexes = [
+            models.Index(fields=['token', 'post']),
+        ]
+
+    def __str__(self):
+        return f'{self.token} -> {self.post_id}'
@@ -0,0 +1,196 @@
+import base64
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import geo
+
+
+class PostPagination(PageNumberPagination):
+    """社区帖子分页器"""
+    page_size = 5  # 默认每页5条
+    page_size_query_param = 'page_size'
+    max_page_size = 20
+
+
+class NearestPagination(PostPagination):
+    """
+    距离排序分页器
+
+    按与用户位置 (lat, lng) 的距离由近到远分页，不执行 COUNT；传入 radius（公里）时
+    只查找该范围内的帖子，范围内不足一页时不再向外扩展。下一页链接携带游标（上一页最后一条的距离和ID），从该距离继续向外查找；
+    同时兼容 page 参数，便于旧版小程序按页码加载。
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = '无效的游标'
+    invalid_location_message = '位置参数格式错误'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        try:
+            latitude, longitude = geo.parse_point(request.query_params.get('lat'), request.query_params.get('lng'))
+            radius = request.query_params.get('radius')
+            max_km = geo.parse_radius(radius) if radius else None
+        except (TypeError, ValueError):
+            raise ValidationError({'error': self.invalid_location_message})
+
+        after = self.decode_cursor(request)
+        offset = 0
+        if after is None:
+            try:
+                page_number = int(request.query_params.get(self.page_query_param, 1))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_page_message)
+            offset = (max(page_number, 1) - 1) * self.page_size
+
+        rows = geo.nearest(
+            queryset, latitude, longitude, offset + self.page_size + 1, after=after, max_km=max_km
+        )
+        rows = rows[offset:]
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last.distance, last.id))
+
+    def get_previous_link(self):
+        return None
+
+    def encode_cursor(self, distance, pk):
+        """将 (距离, ID) 编码为游标"""
+        return base64.urlsafe_b64encode(f'{distance!r}:{pk}'.encode()).decode()
+
+    def decode_cursor(self, request):
+        """解析游标，返回 (距离, ID)；未传游标时返回 None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            distance, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split(':')
+            distance = float(distance)
+            if not math.isfinite(distance):
+                raise ValueError
+            return distance, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class KeysetPagination(PostPagination):
+    """
+    游标（键集）分页器
+
+    按 (排序字段..., id) 的取值定位下一页，不执行 COUNT 也不使用 OFFSET，
+    深层页面与第一页开销相同。请求参数 pagination=cursor 开启，之后沿 next 链接翻页。
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = '无效的游标'
+
+    @classmethod
+    def is_requested(cls, request):
+        """请求是否使用游标分页"""
+        params = request.query_params
+        return params.get(cls.mode_query_param) == 'cursor' or cls.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_previous_link(self):
+        return None
+
+    def get_ordering(self, queryset):
+        """获取查询集的排序字段，并追加 id 保证排序唯一"""
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            field.replace('pk', pk_name) if field.lstrip('-') == 'pk' else field
+            for field in (queryset.query.order_by or queryset.model._meta.ordering or ['-pk'])
+        ]
+        if not any(field.lstrip('-') == pk_name for field in ordering):
+            ordering.append(f'-{pk_name}' if ordering[0].startswith('-') else pk_name)
+        return ordering
+
+    def position_filter(self, position):
+        """构造“排在游标之后”的查询条件：(a, b, id) 按各字段方向逐级比较"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def encode_cursor(self, position):
+        """将上一页最后一条的排序字段取值编码为游标"""
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        """解析游标，返回排序字段取值列表；未传游标时返回 None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                self.to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_python(self, model, name, value):
+        """将游标中的取值还原为字段类型，注解字段（如相关度）直接使用原值"""
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value
@@ -0,0 +1,127 @@
+"""
+社区帖子全文检索
+
+店铺名称、推荐理由和位置地址在保存帖子时切分为词元写入倒排索引表 post_search_tokens。
+中文按单字和相邻两字（二元组）切分，英文和数字按单词的各个前缀（至少2个字符）切分，
+因此输入单词开头的一部分即可命中；查询时帖子需包含查询切分出的全部词元，按命中词元的
+权重之和排序。查询开销只与命中的索引记录数有关。查询词切分不出词元时（如只有标点、
+其他文字或单个字母）回退为逐字段的模糊匹配。
+"""
+import re
+from collections import Counter
+
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+
+# 各字段词元的权重，店铺名称命中排名更靠前
+FIELD_WEIGHTS = {
+    'shop_name': 3,
+    'comment': 1,
+    'location_address': 1,
+}
+
+MAX_TOKEN_LENGTH = 32
+# 英文和数字索引的最短前缀长度
+MIN_PREFIX_LENGTH = 2
+
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]+|[a-z0-9]+')
+
+
+def _is_cjk(char):
+    return '\u4e00' <= char <= '\u9fff' or '\u3400' <= char <= '\u4dbf'
+
+
+def _ngrams(run):
+    """中文连续片段切分为单字和二元组"""
+    tokens = list(run)
+    tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _prefixes(word):
+    """英文和数字单词切分为各个前缀，单个字符不建索引"""
+    word = word[:MAX_TOKEN_LENGTH]
+    return [word[:length] for length in range(MIN_PREFIX_LENGTH, len(word) + 1)]
+
+
+def tokenize(text):
+    """切分文本，返回词元列表（保留重复，用于计算词频）"""
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if _is_cjk(run[0]):
+            tokens.extend(_ngrams(run))
+        else:
+            tokens.extend(_prefixes(run))
+    return tokens
+
+
+def tokenize_query(query):
+    """
+    切分查询词，返回去重后的词元
+
+    单个汉字按单字匹配，多个汉字按二元组匹配；英文和数字按整词匹配索引中的前缀，
+    单个字母不参与匹配。
+    """
+    terms = []
+    for run in _TOKEN_RE.findall((query or '').lower()):
+        if _is_cjk(run[0]):
+            terms.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        elif len(run) >= MIN_PREFIX_LENGTH:
+            terms.append(run[:MAX_TOKEN_LENGTH])
+    return list(dict.fromkeys(terms))
+
+
+def build_tokens(post):
+    """计算帖子的 {词元: 权重}"""
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(post, field)):
+            weights[token] += weight
+    return weights
+
+
+def index_post(post):
+    """重建单个帖子的索引记录"""
+    from .models import PostSearchToken
+
+    PostSearchToken.objects.filter(post=post).delete()
+    PostSearchToken.objects.bulk_create([
+        PostSearchToken(post=post, token=token, weight=weight)
+        for token, weight in build_tokens(post).items()
+    ])
+
+
+def matching_tokens(query):
+    """返回命中查询全部词元的索引记录分组（post_id, rank），查询词无有效词元时返回 None"""
+    from .models import PostSearchToken
+
+    terms = tokenize_query(query)
+    if not terms:
+        return None
+    return PostSearchToken.objects.filter(
+        token__in=terms
+    ).values('post_id').annotate(
+        matched=Count('token'),
+        rank=Sum('weight'),
+    ).filter(matched=len(terms))
+
+
+def fallback_q(query):
+    """查询词无有效词元（单个字母、标点或其他文字）时使用的各字段 icontains 条件"""
+    condition = Q()
+    for field in FIELD_WEIGHTS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+def search_posts(queryset, query):
+    """按关键词筛选帖子，并附加 search_rank 注解（相关度）"""
+    matches = matching_tokens(query)
+    if matches is None:
+        return queryset.filter(fallback_q(query)).annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    rank = matches.filter(post_id=OuterRef('pk')).values('rank')
+    return queryset.filter(
+        id__in=matches.values('post_id')
+    ).annotate(
+        search_rank=Subquery(rank, output_field=IntegerField())
+    )
@@ -1,15 +1,53 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Post, PostImage, PostLike
+from . import geo
 from users.serializers import UserSerializer
+from api import images
+from api.authentication import get_wechat_user
+
+
+def get_liked_post_ids(request, post_ids):
+    """查询当前请求用户在给定帖子中点赞过的帖子ID集合"""
+    user = get_wechat_user(request) if request else None
+    if user is None or not post_ids:
+        return set()
+    return set(
+        PostLike.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+    )
+
+
+class BatchPostListSerializer(serializers.ListSerializer):
+    """批量序列化帖子时一次性查出当前用户的点赞状态，避免逐条查询"""
+
+    def to_representation(self, data):
+        posts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.context['liked_post_ids'] = get_liked_post_ids(
+            self.context.get('request'), [post.id for post in posts]
+        )
+        return super().to_representation(posts)
 
 
 class PostImageSerializer(serializers.ModelSerializer):
     """分享图片序列化器"""
+    thumbnail_url = serializers.SerializerMethodField()
+    webp_url = serializers.SerializerMethodField()
     
     class Meta:
         model = PostImage
-        fields = ['id', 'image_url', 'sort_order', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = [
+            'id', 'image_url', 'thumbnail_url', 'webp_url',
+            'width', 'height', 'sort_order', 'created_at'
+        ]
+        read_only_fields = ['id', 'width', 'height', 'created_at']
+    
+    def get_thumbnail_url(self, obj):
+        """列表页缩略图，衍生图未生成时使用原图"""
+        return images.variant_url(obj.image_url, 'thumb') if obj.variants_ready else obj.image_url
+    
+    def get_webp_url(self, obj):
+        """详情页 WebP 大图，衍生图未生成时使用原图"""
+        return images.variant_url(obj.image_url, 'webp') if obj.variants_ready else obj.image_url
 
 
 class PostLikeSerializer(serializers.ModelSerializer):
@@ -40,43 +78,28 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'likes_count', 'view_count', 'created_at', 'updated_at'
         ]
+        list_serializer_class = BatchPostListSerializer
     
     def get_is_liked(self, obj):
         """获取当前用户是否点赞"""
-        request = self.context.get('request')
-        if request:
-            openid = request.META.get('HTTP_X_OPENID')
-            if openid:
-                try:
-                    from users.models import User
-                    user = User.objects.get(openid=openid)
-                    return PostLike.objects.filter(post=obj, user=user).exists()
-                except User.DoesNotExist:
-                    pass
-        return False
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            return obj.id in liked_post_ids
+        return obj.id in get_liked_post_ids(self.context.get('request'), [obj.id])
     
     def get_distance(self, obj):
         """计算距离（需要前端传入当前位置）"""
+        # 按距离查询时已由数据库计算
+        if getattr(obj, 'distance', None) is not None:
+            return round(obj.distance, 2)
         request = self.context.get('request')
         if request and obj.latitude and obj.longitude:
             user_lat = request.query_params.get('lat')
             user_lng = request.query_params.get('lng')
             if user_lat and user_lng:
-                # 简单的距离计算，实际项目中可以使用更精确的算法
-                import math
                 try:
-                    lat1, lng1 = float(user_lat), float(user_lng)
-                    lat2, lng2 = float(obj.latitude), float(obj.longitude)
-                    
-                    # 使用半正矢公式计算距离
-                    R = 6371  # 地球半径，单位：公里
-                    dlat = math.radians(lat2 - lat1)
-                    dlng = math.radians(lng2 - lng1)
-                    a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng/2) * math.sin(dlng/2)
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                    distance = R * c
-                    return round(distance, 2)
-                except:
+                    return round(geo.haversine(*geo.parse_point(user_lat, user_lng), obj.latitude, obj.longitude), 2)
+                except (TypeError, ValueError):
                     pass
         return None
 
@@ -103,7 +126,8 @@ class PostCreateSerializer(serializers.ModelSerializer):
             PostImage.objects.create(
                 post=post,
                 sort_order=i,
-                **image_data
+                **image_data,
+                **images.describe(image_data['image_url'])
             )
         
         return post
@@ -135,40 +159,27 @@ class PostListSerializer(serializers.ModelSerializer):
             'status', 'likes_count', 'view_count', 'created_at',
             'images', 'is_liked', 'distance'
         ]
+        list_serializer_class = BatchPostListSerializer
     
     def get_is_liked(self, obj):
         """获取当前用户是否点赞"""
-        request = self.context.get('request')
-        if request:
-            openid = request.META.get('HTTP_X_OPENID')
-            if openid:
-                try:
-                    from users.models import User
-                    user = User.objects.get(openid=openid)
-                    return PostLike.objects.filter(post=obj, user=user).exists()
-                except User.DoesNotExist:
-                    pass
-        return False
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            return obj.id in liked_post_ids
+        return obj.id in get_liked_post_ids(self.context.get('request'), [obj.id])
     
     def get_distance(self, obj):
         """计算距离"""
+        # 按距离查询时已由数据库计算
+        if getattr(obj, 'distance', None) is not None:
+            return round(obj.distance, 2)
         request = self.context.get('request')
         if request and obj.latitude and obj.longitude:
             user_lat = request.query_params.get('lat')
             user_lng = request.query_params.get('lng')
             if user_lat and user_lng:
-                import math
                 try:
-                    lat1, lng1 = float(user_lat), float(user_lng)
-                    lat2, lng2 = float(obj.latitude), float(obj.longitude)
-                    
-                    R = 6371
-                    dlat = math.radians(lat2 - lat1)
-                    dlng = math.radians(lng2 - lng1)
-                    a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng/2) * math.sin(dlng/2)
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-                    distance = R * c
-                    return round(distance, 2)
-                except:
+                    return round(geo.haversine(*geo.parse_point(user_lat, user_lng), obj.latitude, obj.longitude), 2)
+                except (TypeError, ValueError):
                     pass
         return None
@@ -0,0 +1,26 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ImageBlob, PostImage
+
+
+@receiver(post_save, sender=PostImage)
+def add_blob_reference(sender, instance, created, update_fields=None, **kwargs):
+    """新增分享图片或更换图片文件时调整引用数"""
+    if update_fields is not None and 'blob' not in update_fields:
+        return
+    previous = None if created else instance._loaded_blob_id
+    if instance.blob_id != previous:
+        if instance.blob_id:
+            ImageBlob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') + 1)
+        if previous:
+            ImageBlob.objects.filter(pk=previous).update(ref_count=F('ref_count') - 1)
+    instance._loaded_blob_id = instance.blob_id
+
+
+@receiver(post_delete, sender=PostImage)
+def remove_blob_reference(sender, instance, **kwargs):
+    """删除分享图片（包括随分享级联删除）时减少图片文件的引用数"""
+    if instance.blob_id:
+        ImageBlob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') - 1)
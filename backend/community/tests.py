@@ -1,3 +1,541 @@
-from django.test import TestCase
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from users.models import User
+from . import geo
+from .management.commands import reconcile_likes_count
+from .models import Post, PostImage, PostLike
+from .serializers import PostListSerializer, PostSerializer
+from .view_counter import view_count_buffer
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0, FEED_CACHE_TTL=0)
+class FeedQueryBudgetTests(APITestCase):
+    """帖子列表查询次数预算测试：查询次数不应随每页条数增长"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(openid='viewer_openid', nickname='浏览者')
+        for i in range(20):
+            author = User.objects.create(openid=f'author_{i}', nickname=f'作者{i}')
+            post = Post.objects.create(
+                user=author,
+                shop_name=f'烧烤店{i}',
+                shop_price=80,
+                comment='好吃',
+                latitude=22.54 + i * 0.001,
+                longitude=114.05 + i * 0.001,
+                status='approved',
+            )
+            for sort_order in range(3):
+                PostImage.objects.create(
+                    post=post,
+                    image_url=f'https://example.com/{i}_{sort_order}.jpg',
+                    sort_order=sort_order,
+                )
+            if i % 2 == 0:
+                PostLike.objects.create(post=post, user=cls.viewer)
+            if i < 10:
+                Post.objects.create(
+                    user=cls.viewer, shop_name=f'我的店{i}', shop_price=50, comment='不错'
+                )
+
+    def test_anonymous_feed_budget(self):
+        """匿名列表：COUNT + 帖子（含发布者） + 图片"""
+        for page_size in (5, 20):
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/community/posts/', {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_authenticated_feed_budget(self):
+        """登录用户列表：额外的认证查询和点赞状态批量查询"""
+        for page_size in (5, 20):
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    '/api/community/posts/', {'page_size': page_size},
+                    HTTP_X_OPENID='viewer_openid'
+                )
+            results = response.data['results']
+            self.assertEqual(len(results), page_size)
+            self.assertTrue(all(len(post['images']) == 3 for post in results))
+            self.assertEqual(
+                [post['images'][0]['sort_order'] for post in results], [0] * page_size
+            )
+
+    def test_nearby_budget(self):
+        """附近列表"""
+        for page_size in (5, 20):
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/community/posts/nearby/', {
+                    'lat': 22.55, 'lng': 114.06, 'radius': 10, 'page_size': page_size
+                })
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_my_posts_budget(self):
+        """我的分享：认证查询 + COUNT + 帖子 + 图片 + 点赞状态"""
+        for page_size in (5, 10):
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    '/api/community/posts/my_posts/', {'page_size': page_size},
+                    HTTP_X_OPENID='viewer_openid'
+                )
+            self.assertEqual(len(response.data['results']), page_size)
+
+
+class LikedStateTests(APITestCase):
+    """批量序列化时的点赞状态"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(openid='viewer_openid', nickname='浏览者')
+        author = User.objects.create(openid='author_openid', nickname='作者')
+        cls.posts = [
+            Post.objects.create(user=author, shop_name=f'烧烤店{i}', shop_price=80, comment='好吃', status='approved')
+            for i in range(4)
+        ]
+        for post in cls.posts[::2]:
+            PostLike.objects.create(post=post, user=cls.viewer)
+
+    def request(self, user=None):
+        request = APIRequestFactory().get('/api/community/posts/')
+        request.user = user
+        return request
+
+    def test_batch_resolves_likes_with_one_query(self):
+        for serializer_class in (PostListSerializer, PostSerializer):
+            posts = list(Post.objects.for_feed().filter(pk__in=[post.pk for post in self.posts]).order_by('id'))
+            serializer = serializer_class(posts, many=True, context={'request': self.request(self.viewer)})
+            with self.assertNumQueries(1):
+                data = serializer.data
+            self.assertEqual([post['is_liked'] for post in data], [True, False, True, False])
+
+    def test_anonymous_is_not_liked(self):
+        posts = Post.objects.filter(pk__in=[post.pk for post in self.posts]).order_by('id')
+        serializer = PostListSerializer(posts, many=True, context={'request': self.request()})
+        self.assertEqual([post['is_liked'] for post in serializer.data], [False] * 4)
+
+    def test_single_post(self):
+        context = {'request': self.request(self.viewer)}
+        self.assertTrue(PostSerializer(self.posts[0], context=context).data['is_liked'])
+        self.assertFalse(PostSerializer(self.posts[1], context=context).data['is_liked'])
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=3600)
+class ViewCountBufferTests(APITestCase):
+    """帖子查看数写缓冲测试"""
+
+    def setUp(self):
+        user = User.objects.create(openid='author_openid', nickname='作者')
+        self.post = Post.objects.create(
+            user=user, shop_name='烧烤店', shop_price=80, comment='好吃', status='approved'
+        )
+
+    def test_views_are_buffered_and_flushed_in_bulk(self):
+        for _ in range(3):
+            response = self.client.get(f'/api/community/posts/{self.post.id}/')
+            self.assertEqual(response.status_code, 200)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 0)
+        self.assertEqual(view_count_buffer.pending(self.post.id), 3)
+
+        with self.assertNumQueries(3):  # 事务开始 + UPDATE + 事务提交
+            view_count_buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 3)
+        self.assertEqual(view_count_buffer.pending(self.post.id), 0)
+
+
+class PostLikeToggleTests(APITestCase):
+    """点赞切换测试"""
+
+    def setUp(self):
+        self.user = User.objects.create(openid='liker_openid', nickname='点赞者')
+        self.post = Post.objects.create(
+            user=self.user, shop_name='烧烤店', shop_price=80, comment='好吃', status='approved'
+        )
+
+    def test_toggle_updates_counter_without_recount(self):
+        is_liked, likes_count = PostLike.toggle(self.post, self.user)
+        self.assertEqual((is_liked, likes_count), (True, 1))
+
+        is_liked, likes_count = PostLike.toggle(self.post, self.user)
+        self.assertEqual((is_liked, likes_count), (False, 0))
+        self.assertFalse(PostLike.objects.exists())
+
+    def test_reconcile_likes_count(self):
+        PostLike.objects.create(post=self.post, user=self.user)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=5)
+
+        call_command('reconcile_likes_count', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_reconcile_recounts_in_update(self):
+        other = Post.objects.create(
+            user=self.user, shop_name='烤鱼店', shop_price=60, comment='不错', status='approved'
+        )
+        Post.objects.filter(pk__in=[self.post.pk, other.pk]).update(likes_count=3)
+
+        # 读出不一致的帖子之后、写回之前发生的点赞也要计入
+        command = reconcile_likes_count.Command(stdout=StringIO())
+        PostLike.objects.create(post=self.post, user=self.user)
+        command._save([self.post.id, other.id], dry_run=False)
+        self.assertEqual(
+            dict(Post.objects.filter(pk__in=[self.post.pk, other.pk]).values_list('id', 'likes_count')),
+            {self.post.id: 1, other.id: 0},
+        )
+
+
+@override_settings(FEED_CACHE_TTL=0)
+class KeysetPaginationTests(APITestCase):
+    """游标分页测试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(openid='author_openid', nickname='作者')
+        for i in range(12):
+            Post.objects.create(
+                user=cls.user, shop_name=f'烧烤店{i}', shop_price=80, comment='好吃',
+                status='approved', likes_count=i % 3, view_count=i % 2
+            )
+
+    def collect(self, params):
+        ids = []
+        response = self.client.get('/api/community/posts/', {**params, 'pagination': 'cursor'})
+        while True:
+            self.assertNotIn('count', response.data)
+            ids.extend(post['id'] for post in response.data['results'])
+            if not response.data['next']:
+                return ids
+            with self.assertNumQueries(2):  # 帖子（含发布者） + 图片，不执行 COUNT
+                response = self.client.get(response.data['next'])
+
+    def test_pages_follow_ordering_without_count(self):
+        for ordering, key, reverse in [
+            ('-created_at', lambda post: (post.created_at, post.id), True),
+            ('-likes_count,-view_count', lambda post: (post.likes_count, post.view_count, post.id), True),
+            ('view_count', lambda post: (post.view_count, post.id), False),
+        ]:
+            expected = [post.id for post in sorted(Post.objects.all(), key=key, reverse=reverse)]
+            self.assertEqual(self.collect({'ordering': ordering, 'page_size': 5}), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/community/posts/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+        # 格式正确但取值无法还原为字段类型的游标
+        tampered = base64.urlsafe_b64encode(json.dumps(['garbage', 1]).encode()).decode()
+        response = self.client.get('/api/community/posts/', {'cursor': tampered})
+        self.assertEqual(response.status_code, 404)
+
+
+class PostSearchTests(APITestCase):
+    """帖子检索测试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(openid='author_openid', nickname='作者')
+        cls.lamb = Post.objects.create(
+            user=user, shop_name='老王烤羊肉串', shop_price=60, comment='羊肉很新鲜', status='approved'
+        )
+        cls.fish = Post.objects.create(
+            user=user, shop_name='烤鱼店', shop_price=90, comment='隔壁的羊肉串也不错', status='approved'
+        )
+        cls.pending = Post.objects.create(
+            user=user, shop_name='羊肉串BBQ', shop_price=50, comment='待审核', status='pending'
+        )
+
+    def search(self, query, **params):
+        response = self.client.get('/api/community/posts/', {'search': query, **params})
+        return [post['id'] for post in response.data['results']]
+
+    def test_search_matches_all_terms(self):
+        self.assertEqual(set(self.search('羊肉串')), {self.lamb.id, self.fish.id})
+        self.assertEqual(self.search('烤鱼'), [self.fish.id])
+        self.assertEqual(self.search('鱼'), [self.fish.id])
+        self.assertEqual(self.search('牛肉'), [])
+
+    def test_relevance_ordering_prefers_shop_name(self):
+        self.assertEqual(self.search('羊肉串', ordering='relevance'), [self.lamb.id, self.fish.id])
+
+    def test_index_follows_updates(self):
+        self.fish.shop_name = '烤生蚝'
+        self.fish.save()
+        self.assertEqual(self.search('烤鱼'), [])
+        self.assertEqual(self.search('生蚝'), [self.fish.id])
+
+    def test_latin_prefix_and_fallback(self):
+        burger = Post.objects.create(
+            user=self.lamb.user, shop_name='Big Burger', shop_price=40, comment='牛肉饼', status='approved'
+        )
+        self.assertEqual(self.search('burg'), [burger.id])
+        self.assertEqual(self.search('BURGER 牛肉'), [burger.id])
+        self.assertEqual(self.search('burgers'), [])
+        # 切分不出词元时按字段模糊匹配
+        self.assertEqual(self.search('g B'), [burger.id])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_unchanged_save_skips_reindex(self):
+        post = Post.objects.get(pk=self.fish.pk)
+        post.view_count = 10
+        with self.assertNumQueries(1):
+            post.save()
+        post.comment = '生蚝很肥'
+        post.save()
+        self.assertEqual(self.search('生蚝'), [self.fish.id])
+
+
+@override_settings(FEED_CACHE_TTL=60, WECHAT_USER_CACHE_TTL=0)
+class FeedCacheTests(APITestCase):
+    """列表页缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create(openid='viewer_openid', nickname='浏览者')
+        self.post = Post.objects.create(
+            user=self.viewer, shop_name='烧烤店', shop_price=80, comment='好吃',
+            latitude=22.54, longitude=114.05, status='approved'
+        )
+        PostLike.objects.create(post=self.post, user=self.viewer)
+
+    def test_cached_page_is_personalized(self):
+        self.client.get('/api/community/posts/')
+        with self.assertNumQueries(2):  # 认证查询 + 点赞状态，不查询帖子
+            response = self.client.get(
+                '/api/community/posts/', {'lat': 22.54, 'lng': 114.06},
+                HTTP_X_OPENID='viewer_openid'
+            )
+        post = response.data['results'][0]
+        self.assertTrue(post['is_liked'])
+        self.assertAlmostEqual(post['distance'], 1.03, places=2)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/community/posts/')
+        self.assertFalse(response.data['results'][0]['is_liked'])
+        self.assertIsNone(response.data['results'][0]['distance'])
+
+    def test_delete_invalidates_cache(self):
+        self.client.get('/api/community/posts/')
+        self.client.delete(f'/api/community/posts/{self.post.id}/')
+        response = self.client.get('/api/community/posts/')
+        self.assertEqual(response.data['results'], [])
+
+
+class OrphanMediaGCTests(APITestCase):
+    """孤立媒体文件清理命令"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.day_dir = os.path.join(self.media_root, 'uploads', 'images', '2025', '01', '01')
+        os.makedirs(self.day_dir)
+        old = time.time() - 7 * 24 * 3600
+        for name in ['kept.jpg', 'kept_thumb.webp', 'orphan.jpg', 'orphan_thumb.webp', 'recent.jpg']:
+            path = os.path.join(self.day_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            if name != 'recent.jpg':
+                os.utime(path, (old, old))
+
+        user = User.objects.create(openid='gc_user', nickname='清理')
+        post = Post.objects.create(user=user, shop_name='烧烤店', shop_price=50, comment='好吃')
+        PostImage.objects.create(
+            post=post, image_url='https://bbq.example.com/media/uploads/images/2025/01/01/kept.jpg'
+        )
+
+    def remaining(self):
+        return sorted(os.listdir(self.day_dir))
+
+    def test_dry_run_keeps_files(self):
+        out = StringIO()
+        call_command('gc_orphan_media', dry_run=True, stdout=out)
+        self.assertIn('找到 2 个孤立文件', out.getvalue())
+        self.assertEqual(len(self.remaining()), 5)
+
+    def test_removes_orphans(self):
+        call_command('gc_orphan_media', stdout=StringIO())
+        self.assertEqual(self.remaining(), ['kept.jpg', 'kept_thumb.webp', 'recent.jpg'])
+
+    def test_quarantine(self):
+        quarantine = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, quarantine)
+        call_command('gc_orphan_media', quarantine=quarantine, stdout=StringIO())
+        self.assertEqual(self.remaining(), ['kept.jpg', 'kept_thumb.webp', 'recent.jpg'])
+        self.assertTrue(os.path.exists(
+            os.path.join(quarantine, 'uploads', 'images', '2025', '01', '01', 'orphan.jpg')
+        ))
+
+
+def destination(latitude, longitude, bearing, distance_km):
+    """从指定点沿方位角（度）移动 distance_km 后的经纬度"""
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    theta, angle = math.radians(bearing), distance_km / geo.EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(theta))
+    lng2 = lng1 + math.atan2(
+        math.sin(theta) * math.sin(angle) * math.cos(lat1),
+        math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+    )
+    lng = (math.degrees(lng2) + 180) % 360 - 180
+    return round(math.degrees(lat2), 8), round(lng, 8)
+
+
+class GeoTests(TestCase):
+    """地理网格编码和半径查询，结果与逐条计算球面距离比对"""
+
+    # (纬度, 经度, 半径公里)：赤道附近、高纬度、极点附近、180度经线附近
+    CASES = [
+        (1.96, 103.8, 50),
+        (5.63, 100.3, 1),
+        (22.54, 114.05, 10),
+        (70.0, 25.0, 100),
+        (89.99, 0.0, 50),
+        (-89.95, 120.0, 30),
+        (10.0, 179.99, 20),
+        (-16.0, -179.95, 15),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(openid='geo_openid', nickname='作者')
+
+    def sample_points(self, latitude, longitude, radius_km):
+        """半径边界内外两侧和范围内随机分布的点"""
+        rng = random.Random(f'{latitude},{longitude},{radius_km}')
+        points = []
+        for bearing in range(0, 360, 15):
+            for ratio in (0.999, 0.9995, 1.001):
+                points.append(destination(latitude, longitude, bearing, radius_km * ratio))
+        for _ in range(40):
+            points.append(destination(latitude, longitude, rng.uniform(0, 360), rng.uniform(0, radius_km * 1.5)))
+        return points
+
+    def test_encode(self):
+        self.assertEqual(geo.encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(geo.encode(57.64911, 10.40744, 9), 'u4pruydqq')
+        for latitude, longitude in [(90, 180), (-90, -180), (0, 0), (-33.87, 151.21)]:
+            lat_min, lat_max, lng_min, lng_max = geo.decode_bbox(geo.encode(latitude, longitude))
+            self.assertTrue(lat_min <= latitude <= lat_max)
+            self.assertTrue(lng_min <= longitude <= lng_max)
+
+    def test_cells_q_matches_prefixes(self):
+        condition = geo.cells_q(['wx4g', 'ezs'])
+        self.assertEqual(
+            sorted(lookup for lookup, _ in condition.children),
+            ['geohash__startswith', 'geohash__startswith'],
+        )
+
+    def test_cover_contains_points_in_radius(self):
+        for latitude, longitude, radius_km in self.CASES:
+            cells = geo.cover(latitude, longitude, radius_km)
+            self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+            for point in self.sample_points(latitude, longitude, radius_km):
+                if geo.haversine(latitude, longitude, *point) <= radius_km:
+                    geohash = geo.encode(*point)
+                    self.assertTrue(
+                        any(geohash.startswith(cell) for cell in cells),
+                        f'{point} 不在 ({latitude}, {longitude}, {radius_km}) 的覆盖网格中'
+                    )
+
+    def test_within_radius_matches_brute_force(self):
+        for latitude, longitude, radius_km in self.CASES:
+            Post.objects.all().delete()
+            expected = set()
+            for point_lat, point_lng in self.sample_points(latitude, longitude, radius_km):
+                post = Post.objects.create(
+                    user=self.user, shop_name='烧烤店', shop_price=80, comment='好吃',
+                    latitude=point_lat, longitude=point_lng, status='approved',
+                )
+                if geo.haversine(latitude, longitude, point_lat, point_lng) <= radius_km:
+                    expected.add(post.id)
+
+            found = set(geo.within_radius(Post.objects.all(), latitude, longitude, radius_km).values_list('id', flat=True))
+            self.assertEqual(found, expected, f'({latitude}, {longitude}, {radius_km})')
+
+
+@override_settings(FEED_CACHE_TTL=0)
+class NearestPaginationTests(APITestCase):
+    """按距离排序的游标分页"""
+
+    CENTER = (22.54, 114.05)
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(openid='nearest_openid', nickname='作者')
+        distances = [0.3, 0.3, 0.8, 2, 3.5, 3.5, 7, 15, 40, 90, 300, 1200, 5000]
+        for i, distance in enumerate(distances):
+            latitude, longitude = destination(*cls.CENTER, i * 37, distance)
+            Post.objects.create(
+                user=user, shop_name=f'烧烤店{i}', shop_price=80, comment='好吃',
+                latitude=latitude, longitude=longitude, status='approved',
+            )
+        Post.objects.create(user=user, shop_name='无位置', shop_price=80, comment='好吃', status='approved')
+        cls.expected = [
+            post.id for post in sorted(
+                Post.objects.filter(latitude__isnull=False),
+                key=lambda post: (geo.haversine(*cls.CENTER, post.latitude, post.longitude), post.id)
+            )
+        ]
+
+    def nearest(self, **params):
+        lat, lng = self.CENTER
+        return self.client.get('/api/community/posts/', {'ordering': 'distance', 'lat': lat, 'lng': lng, **params})
+
+    def collect(self, **params):
+        """沿 next 链接翻完所有页"""
+        response = self.nearest(**params)
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(post['id'] for post in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_distance_without_gaps(self):
+        response = self.nearest(page_size=5)
+        distances = [post['distance'] for post in response.data['results']]
+        self.assertEqual(distances, sorted(distances))
+
+        self.assertEqual(self.collect(page_size=3), self.expected)
+        self.assertEqual(self.collect(page_size=20), self.expected)
+
+    def test_radius_limits_search(self):
+        within = [
+            post.id for post in Post.objects.filter(pk__in=self.expected)
+            if geo.haversine(*self.CENTER, post.latitude, post.longitude) <= 10
+        ]
+        within.sort(key=self.expected.index)
+        # 范围内不足一页时只扫描到半径为止：1、4、10公里三圈查询，再加一次图片查询
+        with self.assertNumQueries(4):
+            response = self.nearest(radius=10, page_size=20)
+        self.assertEqual([post['id'] for post in response.data['results']], within)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_location(self):
+        for lat, lng in [('nan', '114'), ('22', 'inf'), ('-inf', '114'), ('abc', '114'), ('91', '114'), ('22', '181')]:
+            response = self.client.get('/api/community/posts/', {'ordering': 'distance', 'lat': lat, 'lng': lng})
+            self.assertEqual(response.status_code, 400, (lat, lng))
+            response = self.client.get('/api/community/posts/nearby/', {'lat': lat, 'lng': lng})
+            self.assertEqual(response.status_code, 400, (lat, lng))
+
+        response = self.nearest(radius='nan')
+        self.assertEqual(response.status_code, 400)
+        response = self.nearest(cursor='bmFuOjE=')  # "nan:1"
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,111 @@
+"""
+帖子查看数写缓冲
+
+详情页只在进程内累加查看次数，由后台线程定期用 F() 表达式批量写回数据库，
+避免每次查看都同步更新热门帖子所在的行，并发的 worker 之间也不会丢失计数。
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCountBuffer:
+    """进程内的查看数缓冲区"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stopped = threading.Event()
+
+    @property
+    def flush_interval(self):
+        """写回间隔（秒），为0时不缓冲，每次查看直接写回"""
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+    def add(self, post_id, count=1):
+        """记录查看次数"""
+        with self._lock:
+            self._counts[post_id] += count
+
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def pending(self, post_id):
+        """获取尚未写回数据库的查看次数"""
+        with self._lock:
+            return self._counts.get(post_id, 0)
+
+    def flush(self):
+        """将缓冲的查看数批量写回数据库，返回更新的帖子数"""
+        from .models import Post
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        # 增量相同的帖子合并为一条 UPDATE
+        post_ids_by_delta = defaultdict(list)
+        for post_id, delta in counts.items():
+            post_ids_by_delta[delta].append(post_id)
+
+        try:
+            with transaction.atomic():
+                for delta, post_ids in post_ids_by_delta.items():
+                    Post.objects.filter(id__in=post_ids).update(
+                        view_count=F('view_count') + delta
+                    )
+        except Exception:
+            # 写入失败时放回缓冲区，等待下次重试
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+        return len(counts)
+
+    def stop(self):
+        """停止后台线程并写回剩余的查看数"""
+        self._stopped.set()
+        self.flush()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._run, name='view-count-flusher', daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('写回帖子查看数失败')
+            finally:
+                # 后台线程的数据库连接不会随请求结束关闭，需要手动释放
+                connections.close_all()
+
+
+view_count_buffer = ViewCountBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_count_buffer.flush()
+    except Exception:
+        logger.exception('进程退出时写回帖子查看数失败')
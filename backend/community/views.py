@@ -3,23 +3,18 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
-import math
+from api.authentication import get_wechat_user
+from users.models import User
 from .models import Post, PostImage, PostLike
+from . import geo, feed_cache
+from .search import search_posts
+from .pagination import PostPagination, NearestPagination, KeysetPagination
 from .serializers import (
     PostSerializer, PostCreateSerializer, PostUpdateSerializer,
     PostListSerializer, PostLikeSerializer
 )
 
 
-class PostPagination(PageNumberPagination):
-    """社区帖子分页器"""
-    page_size = 5  # 默认每页5条
-    page_size_query_param = 'page_size'
-    max_page_size = 20
-
-
 class PostViewSet(viewsets.ModelViewSet):
     """社区分享视图集"""
     serializer_class = PostSerializer
@@ -28,18 +23,26 @@ class PostViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     pagination_class = PostPagination
     
+    @property
+    def paginator(self):
+        """请求 pagination=cursor 或携带游标时使用游标分页"""
+        if not hasattr(self, '_paginator'):
+            if KeysetPagination.is_requested(self.request):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
     def get_queryset(self):
         """获取已审核通过的分享"""
         queryset = Post.objects.filter(status='approved')
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.for_feed()
         
-        # 搜索功能
+        # 搜索功能（倒排索引检索）
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(shop_name__icontains=search) |
-                Q(shop_location__icontains=search) |
-                Q(comment__icontains=search)
-            )
+            queryset = search_posts(queryset, search)
         
         # 距离筛选（需要前端传入当前位置）
         lat = self.request.query_params.get('lat')
@@ -47,17 +50,11 @@ class PostViewSet(viewsets.ModelViewSet):
         radius = self.request.query_params.get('radius')  # 半径（公里）
         
         if lat and lng and radius:
-            # 简单的边界筛选，实际项目中可以使用 PostGIS 进行精确的地理位置查询
+            # 通过 geohash 网格覆盖筛选，只扫描与半径相交的少量网格
             try:
-                lat_f, lng_f, radius_f = float(lat), float(lng), float(radius)
-                # 粗略计算经纬度范围
-                lat_range = radius_f / 111  # 1度纬度约111公里
-                lng_range = radius_f / (111 * abs(lat_f) * 0.017453)  # 经度随纬度变化
-                
-                queryset = queryset.filter(
-                    latitude__range=[lat_f - lat_range, lat_f + lat_range],
-                    longitude__range=[lng_f - lng_range, lng_f + lng_range]
-                )
+                lat_f, lng_f = geo.parse_point(lat, lng)
+                radius_f = geo.parse_radius(radius)
+                queryset = geo.within_radius(queryset, lat_f, lng_f, radius_f)
             except (ValueError, TypeError):
                 pass
         
@@ -67,19 +64,22 @@ class PostViewSet(viewsets.ModelViewSet):
         """计算两点之间的距离（公里）"""
         if not all([lat1, lng1, lat2, lng2]):
             return float('inf')  # 如果位置信息不完整，返回无穷大
-        
-        R = 6371  # 地球半径（公里）
-        dlat = math.radians(lat2 - lat1)
-        dlng = math.radians(lng2 - lng1)
-        a = (math.sin(dlat/2) * math.sin(dlat/2) + 
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * 
-             math.sin(dlng/2) * math.sin(dlng/2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        distance = R * c
-        return round(distance, 2)
+        return round(geo.haversine(lat1, lng1, lat2, lng2), 2)
     
     def list(self, request, *args, **kwargs):
         """重写list方法，支持距离排序"""
+        # 与用户无关的列表页走缓存，命中后再合并点赞状态和距离
+        cache_key = feed_cache.get_cache_key(request)
+        if cache_key is not None:
+            payload = feed_cache.get_page(cache_key)
+            if payload is None:
+                queryset = self.filter_queryset(self.get_queryset())
+                page = self.paginate_queryset(queryset)
+                serializer = PostListSerializer(page, many=True, context={'view': self})
+                payload = self.get_paginated_response(serializer.data).data
+                feed_cache.set_page(cache_key, payload)
+            return Response(feed_cache.personalize(payload, request))
+        
         queryset = self.filter_queryset(self.get_queryset())
         
         # 检查是否需要按距离排序
@@ -87,31 +87,17 @@ class PostViewSet(viewsets.ModelViewSet):
         user_lat = request.query_params.get('lat')
         user_lng = request.query_params.get('lng')
         
+        # 搜索时可按相关度排序
+        if ordering == 'relevance' and request.query_params.get('search'):
+            queryset = queryset.order_by('-search_rank', '-created_at')
+        
         if ordering == 'distance' and user_lat and user_lng:
-            try:
-                user_lat_f = float(user_lat)
-                user_lng_f = float(user_lng)
-                
-                # 使用数据库层面的距离计算和排序
-                # Haversine公式的SQL实现
-                queryset = queryset.extra(
-                    select={
-                        'distance': '''
-                            6371 * 2 * ASIN(SQRT(
-                                POWER(SIN((RADIANS(latitude) - RADIANS(%s)) / 2), 2) +
-                                COS(RADIANS(%s)) * COS(RADIANS(latitude)) *
-                                POWER(SIN((RADIANS(longitude) - RADIANS(%s)) / 2), 2)
-                            ))
-                        '''
-                    },
-                    select_params=[user_lat_f, user_lat_f, user_lng_f]
-                ).order_by('distance')
-                
-            except (ValueError, TypeError):
-                # 如果位置参数有问题，回退到普通查询
-                pass
+            # 按圆环向外扩展查找最近的帖子，只对候选记录计算距离并排序；位置参数无效时返回400
+            paginator = NearestPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
         
-        # 普通查询或距离排序后的查询都使用相同的分页逻辑
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -133,20 +119,18 @@ class PostViewSet(viewsets.ModelViewSet):
         """列表和详情允许匿名访问"""
         return [AllowAny()]
     
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        feed_cache.invalidate()
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        feed_cache.invalidate()
+    
     def perform_create(self, serializer):
         """创建分享时设置用户"""
-        openid = self.request.META.get('HTTP_X_OPENID')
-        if openid:
-            try:
-                from users.models import User
-                user = User.objects.get(openid=openid)
-                serializer.save(user=user)
-                return
-            except User.DoesNotExist:
-                pass
-        # 如果没有找到用户，使用第一个用户作为默认值（测试用）
-        from users.models import User
-        user = User.objects.first()
+        # 如果没有登录用户，使用第一个用户作为默认值（测试用）
+        user = get_wechat_user(self.request) or User.objects.first()
         serializer.save(user=user)
     
     def retrieve(self, request, *args, **kwargs):
@@ -160,35 +144,13 @@ class PostViewSet(viewsets.ModelViewSet):
     def like(self, request, pk=None):
         """点赞/取消点赞"""
         post = self.get_object()
-        openid = request.META.get('HTTP_X_OPENID')
-        
-        if openid:
-            try:
-                from users.models import User
-                user = User.objects.get(openid=openid)
-            except User.DoesNotExist:
-                user = User.objects.first()  # 测试用默认用户
-        else:
-            user = User.objects.first()  # 测试用默认用户
-        
-        like_obj, created = PostLike.objects.get_or_create(
-            post=post,
-            user=user
-        )
+        user = get_wechat_user(request) or User.objects.first()  # 测试用默认用户
         
-        if not created:
-            # 如果已经点赞，则取消点赞
-            like_obj.delete()
-            is_liked = False
-        else:
-            is_liked = True
-        
-        # 重新获取点赞数
-        post.refresh_from_db()
+        is_liked, likes_count = PostLike.toggle(post, user)
         
         return Response({
             'is_liked': is_liked,
-            'likes_count': post.likes_count
+            'likes_count': likes_count
         })
     
     @action(detail=True, methods=['get'])
@@ -208,19 +170,10 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_posts(self, request):
         """获取我的分享"""
-        openid = request.META.get('HTTP_X_OPENID')
-        
-        if openid:
-            try:
-                from users.models import User
-                user = User.objects.get(openid=openid)
-            except User.DoesNotExist:
-                user = User.objects.first()  # 测试用默认用户
-        else:
-            user = User.objects.first()  # 测试用默认用户
+        user = get_wechat_user(request) or User.objects.first()  # 测试用默认用户
         
         # 获取用户的所有帖子，不过滤状态
-        queryset = Post.objects.filter(user=user).order_by('-created_at')
+        queryset = Post.objects.filter(user=user).for_feed().order_by('-created_at')
         
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -239,18 +192,11 @@ class PostViewSet(viewsets.ModelViewSet):
         if not lat or not lng:
             return Response({'error': '缺少位置参数'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 默认10公里范围
-        radius = float(request.query_params.get('radius', '10'))
-        
         try:
-            lat_f, lng_f = float(lat), float(lng)
-            lat_range = radius / 111
-            lng_range = radius / (111 * abs(lat_f) * 0.017453)
-            
-            queryset = Post.objects.filter(
-                status='approved',
-                latitude__range=[lat_f - lat_range, lat_f + lat_range],
-                longitude__range=[lng_f - lng_range, lng_f + lng_range]
+            lat_f, lng_f = geo.parse_point(lat, lng)
+            radius = geo.parse_radius(request.query_params.get('radius', '10'))  # 默认10公里范围
+            queryset = geo.within_radius(
+                Post.objects.filter(status='approved').for_feed(), lat_f, lng_f, radius
             ).order_by('-created_at')
             
             page = self.paginate_queryset(queryset)
@@ -146,6 +146,51 @@ CORS_ALLOW_CREDENTIALS = True
 WECHAT_APP_ID = os.getenv('WECHAT_APP_ID', 'your_wechat_app_id')
 WECHAT_APP_SECRET = os.getenv('WECHAT_APP_SECRET', 'your_wechat_app_secret')
 
+# 微信接口：地址（测试时可指向本地桩服务）、连接/读取超时（秒）、重试次数和熔断参数
+WECHAT_API_BASE_URL = os.getenv('WECHAT_API_BASE_URL', 'https://api.weixin.qq.com')
+WECHAT_CONNECT_TIMEOUT = float(os.getenv('WECHAT_CONNECT_TIMEOUT', '2'))
+WECHAT_READ_TIMEOUT = float(os.getenv('WECHAT_READ_TIMEOUT', '3'))
+WECHAT_MAX_RETRIES = int(os.getenv('WECHAT_MAX_RETRIES', '2'))
+WECHAT_BREAKER_THRESHOLD = int(os.getenv('WECHAT_BREAKER_THRESHOLD', '5'))
+WECHAT_BREAKER_RESET_TIMEOUT = int(os.getenv('WECHAT_BREAKER_RESET_TIMEOUT', '30'))
+
+# 缓存配置：配置 REDIS_URL 时使用 Redis 在多个 worker 之间共享缓存
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# 未配置 Redis 时各 worker 的缓存互不相通，一个 worker 上的缓存失效到达不了其他 worker，
+# 因此依赖缓存失效的缓存默认关闭
+_cache_shared = bool(os.getenv('REDIS_URL'))
+
+# 社区列表页缓存时间（秒），为0时不缓存
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', '30' if _cache_shared else '0'))
+
+# 认证用户缓存时间（秒），为0时不缓存
+WECHAT_USER_CACHE_TTL = int(os.getenv('WECHAT_USER_CACHE_TTL', '60' if _cache_shared else '0'))
+
+# 帖子查看数缓冲写回间隔（秒），为0时每次查看直接写库
+VIEW_COUNT_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '10'))
+
+# 订单状态轮询 ETag 的缓存时间（秒），订单写入时会主动更新；为0时不缓存，每次查询数据库
+ORDER_STATE_CACHE_TTL = int(os.getenv('ORDER_STATE_CACHE_TTL', '600' if _cache_shared else '0'))
+
+# 生成图片缩略图和 WebP 图的线程数，为0时在上传请求中同步生成
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', '2'))
+
+# 上传图片的最大像素数，超过时在解码前拒绝
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', '50000000'))
+
 # 安全设置（生产环境）
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
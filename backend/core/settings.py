@@ -194,6 +194,14 @@ CORS_ALLOW_CREDENTIALS = True
 WECHAT_APP_ID = os.getenv('WECHAT_APP_ID', 'your_wechat_app_id')  # 替换为实际的小程序AppID
 WECHAT_APP_SECRET = os.getenv('WECHAT_APP_SECRET', 'your_wechat_app_secret')  # 替换为实际的小程序AppSecret
 
+# 微信接口：地址（测试时可指向本地桩服务）、连接/读取超时（秒）、重试次数和熔断参数
+WECHAT_API_BASE_URL = os.getenv('WECHAT_API_BASE_URL', 'https://api.weixin.qq.com')
+WECHAT_CONNECT_TIMEOUT = float(os.getenv('WECHAT_CONNECT_TIMEOUT', '2'))
+WECHAT_READ_TIMEOUT = float(os.getenv('WECHAT_READ_TIMEOUT', '3'))
+WECHAT_MAX_RETRIES = int(os.getenv('WECHAT_MAX_RETRIES', '2'))
+WECHAT_BREAKER_THRESHOLD = int(os.getenv('WECHAT_BREAKER_THRESHOLD', '5'))
+WECHAT_BREAKER_RESET_TIMEOUT = int(os.getenv('WECHAT_BREAKER_RESET_TIMEOUT', '30'))
+
 # 媒体文件配置
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -205,3 +213,26 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
 # 允许的图片格式
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
 MAX_IMAGE_SIZE = 2 * 1024 * 1024  # 2MB
+MAX_IMAGE_PIXELS = 50_000_000  # 超过该像素数的图片在解码前拒绝
+
+# 缓存配置（开发环境使用本地内存缓存）
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# 社区列表页缓存时间（秒），为0时不缓存
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', '30'))
+
+# 认证用户缓存时间（秒），为0时不缓存
+WECHAT_USER_CACHE_TTL = int(os.getenv('WECHAT_USER_CACHE_TTL', '60'))
+
+# 帖子查看数缓冲写回间隔（秒），为0时每次查看直接写库
+VIEW_COUNT_FLUSH_INTERVAL = int(os.getenv('VIEW_COUNT_FLUSH_INTERVAL', '10'))
+
+# 订单状态轮询 ETag 的缓存时间（秒），订单写入时会主动更新；为0时不缓存，每次查询数据库
+ORDER_STATE_CACHE_TTL = int(os.getenv('ORDER_STATE_CACHE_TTL', '600'))
+
+# 生成图片缩略图和 WebP 图的线程数，为0时在上传请求中同步生成
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', '2'))
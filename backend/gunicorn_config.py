@@ -32,3 +32,11 @@ pidfile = "/www/wwwroot/miao-bbq-backend/gunicorn.pid"
 # 用户和组
 user = "www"
 group = "www"
+
+
+def worker_exit(server, worker):
+    """worker 退出前写回缓冲的帖子查看数，并等待图片衍生图处理完成"""
+    from community.view_counter import view_count_buffer
+    from api import images
+    view_count_buffer.stop()
+    images.shutdown()
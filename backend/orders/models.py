@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import Count, F, Sum
 from django.utils import timezone
 from users.models import User
 
+from . import polling
+
 
 class Order(models.Model):
     """订单表"""
@@ -35,11 +38,23 @@ class Order(models.Model):
         return f'订单#{self.id} - {self.user.nickname}'
 
     def calculate_total(self):
-        """计算订单总金额"""
-        total = sum(item.subtotal for item in self.orderitem_set.all())
-        self.total_amount = total
-        self.save()
-        return total
+        """用数据库聚合重新计算订单总金额和菜品数量"""
+        totals = self.orderitem_set.aggregate(total=Sum('subtotal'), count=Count('id'))
+        self.total_amount = totals['total'] or 0
+        self.item_count = totals['count']
+        self.save(update_fields=['total_amount', 'item_count', 'updated_at'])
+        return self.total_amount
+
+    def apply_item_change(self, amount_delta, count_delta=0):
+        """按增量更新订单总金额和菜品数量（应在锁定订单行的事务中调用）"""
+        now = timezone.now()
+        Order.objects.filter(pk=self.pk).update(
+            total_amount=F('total_amount') + amount_delta,
+            item_count=F('item_count') + count_delta,
+            updated_at=now,
+        )
+        # update() 不触发 post_save 信号，手动更新状态轮询的 ETag
+        polling.touch(self.user_id, self.pk, now)
 
 
 class OrderItem(models.Model):
@@ -0,0 +1,70 @@
+"""
+订单状态轮询
+
+订单状态接口用 updated_at 生成 ETag。客户端携带 If-None-Match 时，订单未变化直接返回 304，
+不在服务端等待（gunicorn 使用同步 worker，挂起的请求会占满 worker）。
+
+当前 ETag 按 (用户, 订单) 保存在缓存中，订单写入并提交后更新，轮询命中时不查询数据库；
+缓存未命中时读取订单并回填。只有各 worker 共享缓存（如 Redis）时缓存的 ETag 才可靠，
+ORDER_STATE_CACHE_TTL 为0时不使用缓存，每次按数据库中的 updated_at 比较。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+
+
+def _timeout():
+    return getattr(settings, 'ORDER_STATE_CACHE_TTL', 600)
+
+
+def _enabled():
+    return _timeout() > 0
+
+
+def _cache_key(user_id, order_id):
+    return f'order_state:{user_id}:{order_id}'
+
+
+def get_etag(order_id, updated_at):
+    """由订单ID和更新时间生成 ETag"""
+    return f'"{order_id}-{int(updated_at.timestamp() * 1000000)}"'
+
+
+def etag_matches(request, etag):
+    """请求的 If-None-Match 是否包含当前 ETag"""
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in etags or etag.strip('"') in [value.removeprefix('W/').strip('"') for value in etags]
+
+
+def cached_etag(user_id, order_id):
+    """缓存中订单的当前 ETag，未缓存或未启用缓存时返回 None"""
+    if not _enabled():
+        return None
+    return cache.get(_cache_key(user_id, order_id))
+
+
+def remember(order):
+    """
+    回填订单的当前 ETag
+
+    只在缓存中没有记录时写入，避免读到旧数据的请求覆盖订单写入后保存的新 ETag。
+    """
+    if not _enabled():
+        return
+    cache.add(_cache_key(order.user_id, order.id), get_etag(order.id, order.updated_at), _timeout())
+
+
+def touch(user_id, order_id, updated_at):
+    """订单写入后（事务提交时）保存新的 ETag"""
+    if not _enabled():
+        return
+    etag = get_etag(order_id, updated_at)
+    transaction.on_commit(lambda: cache.set(_cache_key(user_id, order_id), etag, _timeout()))
+
+
+def forget(user_id, order_id):
+    """订单删除后（事务提交时）清除 ETag"""
+    if not _enabled():
+        return
+    transaction.on_commit(lambda: cache.delete(_cache_key(user_id, order_id)))
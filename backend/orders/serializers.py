@@ -1,3 +1,7 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Order, OrderItem
 from users.serializers import UserSerializer
@@ -23,6 +27,46 @@ class OrderItemCreateSerializer(serializers.ModelSerializer):
         fields = ['dish_name', 'unit_price', 'quantity']
 
 
+class OrderItemOperationSerializer(serializers.Serializer):
+    """批量修改菜品中的单个操作"""
+    REQUIRED_FIELDS = {
+        'add': ['dish_name', 'unit_price', 'quantity'],
+        'update': ['item_id', 'quantity'],
+        'remove': ['item_id'],
+    }
+
+    op_id = serializers.CharField(max_length=64)
+    action = serializers.ChoiceField(choices=list(REQUIRED_FIELDS))
+    item_id = serializers.IntegerField(required=False)
+    dish_name = serializers.CharField(max_length=100, required=False)
+    unit_price = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        missing = [
+            field for field in self.REQUIRED_FIELDS[attrs['action']]
+            if attrs.get(field) is None
+        ]
+        if missing:
+            raise serializers.ValidationError({field: '该字段是必填项。' for field in missing})
+        return attrs
+
+
+class OrderItemBatchSerializer(serializers.Serializer):
+    """批量修改菜品序列化器"""
+    MAX_OPERATIONS = 100
+
+    operations = OrderItemOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        if len(operations) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(f'单次最多提交{self.MAX_OPERATIONS}个操作')
+        op_ids = [operation['op_id'] for operation in operations]
+        if len(set(op_ids)) != len(op_ids):
+            raise serializers.ValidationError('op_id 不能重复')
+        return operations
+
+
 class OrderSerializer(serializers.ModelSerializer):
     """订单序列化器"""
     user = UserSerializer(read_only=True)
@@ -38,6 +82,31 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'total_amount', 'item_count', 'created_at', 'updated_at']
 
 
+class OrderListSerializer(OrderSerializer):
+    """订单列表序列化器（不含菜品明细）"""
+    
+    class Meta(OrderSerializer.Meta):
+        fields = [field for field in OrderSerializer.Meta.fields if field != 'items']
+
+
+class OrderStateSerializer(serializers.ModelSerializer):
+    """订单状态序列化器（轮询用）"""
+    elapsed_seconds = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'status', 'total_amount', 'item_count',
+            'start_time', 'complete_time', 'waiting_seconds', 'elapsed_seconds', 'updated_at'
+        ]
+    
+    def get_elapsed_seconds(self, obj):
+        """已等待秒数：进行中的订单按服务器当前时间计算"""
+        if obj.status == 'processing' and obj.start_time:
+            return int((timezone.now() - obj.start_time).total_seconds())
+        return obj.waiting_seconds
+
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     """订单创建序列化器"""
     items = OrderItemCreateSerializer(many=True)
@@ -48,14 +117,20 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
         
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        # 先在内存中计算小计和订单统计，订单一次写入最终金额
+        items = [
+            OrderItem(subtotal=item_data['unit_price'] * item_data['quantity'], **item_data)
+            for item_data in items_data
+        ]
+        validated_data['total_amount'] = sum((item.subtotal for item in items), Decimal('0'))
+        validated_data['item_count'] = len(items)
         
-        # 计算订单总金额和菜品数量
-        order.item_count = len(items_data)
-        order.calculate_total()
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
         
         return order
     
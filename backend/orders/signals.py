@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import polling
+from .models import Order
+
+
+@receiver(post_save, sender=Order)
+def update_order_etag(sender, instance, **kwargs):
+    """订单保存后更新状态轮询的 ETag"""
+    polling.touch(instance.user_id, instance.id, instance.updated_at)
+
+
+@receiver(post_delete, sender=Order)
+def delete_order_etag(sender, instance, **kwargs):
+    """订单删除后清除状态轮询的 ETag"""
+    polling.forget(instance.user_id, instance.id)
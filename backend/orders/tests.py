@@ -1,3 +1,284 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.models import User
+from . import polling
+from .models import Order, OrderItem
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class OrderItemTotalsTests(TestCase):
+    """菜品增删改后订单统计按增量更新"""
+
+    def setUp(self):
+        self.user = User.objects.create(openid='order_openid', nickname='订单用户')
+        self.order = Order.objects.create(user=self.user)
+        self.item = OrderItem.objects.create(
+            order=self.order, dish_name='羊肉串', unit_price=Decimal('3.50'), quantity=4
+        )
+        self.order.calculate_total()
+        self.url = f'/api/orders/orders/{self.order.id}/'
+
+    def post(self, action, data):
+        return self.client.post(
+            self.url + action + '/', data, content_type='application/json',
+            HTTP_X_OPENID='order_openid',
+        )
+
+    def test_calculate_total_uses_aggregate(self):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('14.00'))
+        self.assertEqual(self.order.item_count, 1)
+
+    def test_add_item(self):
+        response = self.post('add_item', {'dish_name': '鸡翅', 'unit_price': '8.00', 'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('30.00'))
+        self.assertEqual(self.order.item_count, 2)
+
+    def test_update_item(self):
+        response = self.post('update_item', {'item_id': self.item.id, 'quantity': 10})
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('35.00'))
+        self.assertEqual(self.order.item_count, 1)
+
+    def test_remove_item(self):
+        response = self.client.delete(
+            self.url + f'remove_item/?item_id={self.item.id}', HTTP_X_OPENID='order_openid'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('0.00'))
+        self.assertEqual(self.order.item_count, 0)
+
+    def test_completed_order_is_not_modified(self):
+        Order.objects.filter(pk=self.order.pk).update(status='completed')
+        response = self.post('add_item', {'dish_name': '鸡翅', 'unit_price': '8.00', 'quantity': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.order.orderitem_set.count(), 1)
+
+
+    def test_batch_items(self):
+        other = OrderItem.objects.create(
+            order=self.order, dish_name='韭菜', unit_price=Decimal('2.00'), quantity=1
+        )
+        response = self.post('batch_items', {'operations': [
+            {'op_id': 'a1', 'action': 'add', 'dish_name': '鸡翅', 'unit_price': '8.00', 'quantity': 2},
+            {'op_id': 'a2', 'action': 'update', 'item_id': self.item.id, 'quantity': 2},
+            {'op_id': 'a3', 'action': 'remove', 'item_id': other.id},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['op_id'] for r in response.data['results']], ['a1', 'a2', 'a3'])
+        self.assertEqual(response.data['order']['item_count'], 2)
+        self.assertEqual(Decimal(response.data['order']['total_amount']), Decimal('23.00'))
+        self.assertFalse(OrderItem.objects.filter(id=other.id).exists())
+
+    def test_batch_adds_use_one_insert(self):
+        operations = [
+            {'op_id': f'a{i}', 'action': 'add', 'dish_name': f'烤串{i}', 'unit_price': '2.00', 'quantity': i + 1}
+            for i in range(5)
+        ]
+        for returns_rows in (True, False):
+            with mock.patch.object(
+                type(connection.features), 'can_return_rows_from_bulk_insert',
+                new_callable=mock.PropertyMock, return_value=returns_rows,
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.post('batch_items', {'operations': operations})
+            self.assertEqual(response.status_code, 200)
+            inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "order_items"')]
+            self.assertEqual(len(inserts), 1)
+            for result, op in zip(response.data['results'], operations):
+                item = OrderItem.objects.get(pk=result['item_id'])
+                self.assertEqual((item.dish_name, item.subtotal), (op['dish_name'], Decimal('2.00') * op['quantity']))
+
+    def test_batch_items_is_all_or_nothing(self):
+        response = self.post('batch_items', {'operations': [
+            {'op_id': 'a1', 'action': 'add', 'dish_name': '鸡翅', 'unit_price': '8.00', 'quantity': 2},
+            {'op_id': 'a2', 'action': 'remove', 'item_id': self.item.id},
+            {'op_id': 'a3', 'action': 'update', 'item_id': self.item.id, 'quantity': 3},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['op_id'], 'a3')
+        self.assertEqual(self.order.orderitem_set.count(), 1)
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class OrderCreateTests(TestCase):
+    """创建订单时批量写入菜品"""
+
+    def setUp(self):
+        User.objects.create(openid='order_openid', nickname='订单用户')
+
+    def create_order(self, count):
+        items = [
+            {'dish_name': f'烤串{i}', 'unit_price': '2.50', 'quantity': 2}
+            for i in range(count)
+        ]
+        return self.client.post(
+            '/api/orders/orders/', {'status': 'pending', 'items': items},
+            content_type='application/json', HTTP_X_OPENID='order_openid',
+        )
+
+    def test_totals_written_on_create(self):
+        response = self.create_order(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['item_count'], 3)
+        self.assertEqual(Decimal(response.data['total_amount']), Decimal('15.00'))
+        self.assertEqual(len(response.data['items']), 3)
+
+    def test_query_count_independent_of_item_count(self):
+        with CaptureQueriesContext(connection) as small:
+            self.create_order(2)
+        with CaptureQueriesContext(connection) as large:
+            self.create_order(40)
+        self.assertEqual(len(small), len(large))
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class OrderStatisticsTests(TestCase):
+    """订单统计在数据库中聚合"""
+
+    def setUp(self):
+        user = User.objects.create(openid='order_openid', nickname='订单用户')
+        for status, price, dish in [('pending', '10.00', '羊肉串'), ('completed', '20.00', '羊肉串'),
+                                    ('completed', '45.00', '烤鱼')]:
+            order = Order.objects.create(user=user, status=status)
+            OrderItem.objects.create(order=order, dish_name=dish, unit_price=Decimal(price), quantity=1)
+            order.calculate_total()
+
+    def get(self, query=''):
+        return self.client.get('/api/orders/orders/statistics/' + query, HTTP_X_OPENID='order_openid')
+
+    def test_single_aggregate_query(self):
+        with self.assertNumQueries(2):  # 用户查询 + 聚合查询
+            response = self.get()
+        self.assertEqual(response.data['total_orders'], 3)
+        self.assertEqual(response.data['pending_orders'], 1)
+        self.assertEqual(response.data['completed_orders'], 2)
+        self.assertEqual(response.data['total_amount'], Decimal('75.00'))
+        self.assertEqual(response.data['average_amount'], Decimal('25.00'))
+
+    def test_date_range_and_top_dishes(self):
+        today = timezone.localdate().isoformat()
+        response = self.get(f'?start_date={today}&end_date={today}&top_dishes=1')
+        self.assertEqual(response.data['total_orders'], 3)
+        self.assertEqual(response.data['top_dishes']['by_quantity'][0]['dish_name'], '羊肉串')
+        self.assertEqual(response.data['top_dishes']['by_amount'][0]['dish_name'], '烤鱼')
+
+        response = self.get('?end_date=2000-01-01')
+        self.assertEqual(response.data['total_orders'], 0)
+        self.assertEqual(response.data['total_amount'], 0)
+
+    def test_invalid_params(self):
+        for query in ['?start_date=2024-13-01', '?start_date=abc', '?end_date=2024/01/01',
+                      '?top_dishes=-1', '?top_dishes=x']:
+            self.assertEqual(self.get(query).status_code, 400, query)
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class OrderListTests(TestCase):
+    """订单列表预加载用户和菜品"""
+
+    def setUp(self):
+        user = User.objects.create(openid='order_openid', nickname='订单用户')
+        for _ in range(3):
+            order = Order.objects.create(user=user)
+            OrderItem.objects.create(order=order, dish_name='羊肉串', unit_price=Decimal('3.00'), quantity=2)
+
+    def get(self, query=''):
+        return self.client.get('/api/orders/orders/' + query, HTTP_X_OPENID='order_openid')
+
+    def test_summary_list_omits_items(self):
+        with self.assertNumQueries(3):  # 用户 + COUNT + 订单（含用户）
+            response = self.get()
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertNotIn('items', response.data['results'][0])
+
+    def test_expand_items_prefetches(self):
+        with self.assertNumQueries(4):  # 用户 + COUNT + 订单（含用户） + 菜品
+            response = self.get('?expand=items')
+        self.assertEqual(len(response.data['results'][0]['items']), 1)
+
+
+@override_settings(WECHAT_USER_CACHE_TTL=0)
+class OrderStateTests(TestCase):
+    """订单状态轮询接口"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(openid='order_openid', nickname='订单用户')
+        self.order = Order.objects.create(user=user, status='pending')
+        self.url = f'/api/orders/orders/{self.order.id}/'
+
+    def get_state(self, etag=None):
+        headers = {'HTTP_X_OPENID': 'order_openid'}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        return self.client.get(self.url + 'state/', **headers)
+
+    def test_not_modified(self):
+        response = self.get_state()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('items', response.data)
+        etag = response['ETag']
+
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    @override_settings(WECHAT_USER_CACHE_TTL=60)
+    def test_not_modified_skips_database(self):
+        etag = self.get_state()['ETag']
+        with self.assertNumQueries(0):
+            response = self.get_state(etag)
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(ORDER_STATE_CACHE_TTL=0)
+    def test_without_cache_compares_database(self):
+        etag = self.get_state()['ETag']
+        self.assertIsNone(polling.cached_etag(self.order.user_id, self.order.id))
+        # 不执行提交回调：模拟修改由不共享缓存的其他 worker 处理
+        self.client.post(
+            self.url + 'add_item/', {'dish_name': '羊肉串', 'unit_price': '3.00', 'quantity': 2},
+            content_type='application/json', HTTP_X_OPENID='order_openid',
+        )
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item_count'], 1)
+        self.assertEqual(self.get_state(response['ETag']).status_code, 304)
+
+    def test_item_change_updates_etag(self):
+        etag = self.get_state()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                self.url + 'add_item/', {'dish_name': '羊肉串', 'unit_price': '3.00', 'quantity': 2},
+                content_type='application/json', HTTP_X_OPENID='order_openid',
+            )
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item_count'], 1)
+
+    def test_other_user_cannot_read_state(self):
+        etag = self.get_state()['ETag']
+        User.objects.create(openid='other_openid', nickname='其他用户')
+        response = self.client.get(self.url + 'state/', HTTP_X_OPENID='other_openid', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_status_change_updates_etag(self):
+        etag = self.get_state()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url + 'start_timer/', HTTP_X_OPENID='order_openid')
+
+        response = self.get_state(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'processing')
+        self.assertNotEqual(response['ETag'], etag)
@@ -1,15 +1,25 @@
-from django.shortcuts import render
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from .models import Order, OrderItem
+from . import polling
 from .serializers import (
-    OrderSerializer, OrderCreateSerializer, OrderUpdateSerializer,
-    OrderItemSerializer, OrderItemCreateSerializer
+    OrderSerializer, OrderListSerializer, OrderStateSerializer, OrderCreateSerializer, OrderUpdateSerializer,
+    OrderItemSerializer, OrderItemCreateSerializer, OrderItemBatchSerializer
 )
 from users.models import User
+from api.authentication import get_wechat_user
+
+# 菜品排行最多返回的条数
+MAX_TOP_DISHES = 20
 
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -18,21 +28,29 @@ class OrderViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """只返回当前用户的订单"""
-        # 临时处理：通过openid获取用户
-        openid = self.request.META.get('HTTP_X_OPENID')
-        if openid:
-            try:
-                user = User.objects.get(openid=openid)
-                return Order.objects.filter(user=user).order_by('-created_at')
-            except User.DoesNotExist:
-                pass
-        return Order.objects.none()
+        user = get_wechat_user(self.request)
+        if user is None:
+            return Order.objects.none()
+        
+        queryset = Order.objects.filter(user=user).order_by('-created_at')
+        if self.action in ['list', 'retrieve']:
+            queryset = queryset.select_related('user')
+            if self.action == 'retrieve' or self.expand_items:
+                queryset = queryset.prefetch_related('orderitem_set')
+        return queryset
+    
+    @property
+    def expand_items(self):
+        """列表请求 expand=items 时返回菜品明细"""
+        return 'items' in self.request.query_params.get('expand', '').split(',')
     
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return OrderUpdateSerializer
+        elif self.action == 'list' and not self.expand_items:
+            return OrderListSerializer
         return OrderSerializer
     
     def get_permissions(self):
@@ -41,16 +59,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         """创建订单时设置用户"""
-        openid = self.request.META.get('HTTP_X_OPENID')
-        if openid:
-            try:
-                user = User.objects.get(openid=openid)
-                serializer.save(user=user)
-                return
-            except User.DoesNotExist:
-                pass
-        # 如果没有找到用户，使用第一个用户作为默认值（测试用）
-        user = User.objects.first()
+        # 如果没有登录用户，使用第一个用户作为默认值（测试用）
+        user = get_wechat_user(self.request) or User.objects.first()
         serializer.save(user=user)
     
     @action(detail=True, methods=['post'])
@@ -62,7 +72,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         order.status = 'processing'
         order.start_time = timezone.now()
-        order.save(update_fields=['status', 'start_time'])
+        order.save(update_fields=['status', 'start_time', 'updated_at'])
         
         return Response(OrderSerializer(order).data)
     
@@ -81,56 +91,76 @@ class OrderViewSet(viewsets.ModelViewSet):
             waiting_time = (order.complete_time - order.start_time).total_seconds()
             order.waiting_seconds = int(waiting_time)
         
-        order.save(update_fields=['status', 'complete_time', 'waiting_seconds'])
+        order.save(update_fields=['status', 'complete_time', 'waiting_seconds', 'updated_at'])
         
         return Response(OrderSerializer(order).data)
     
+    @action(detail=True, methods=['get'])
+    def state(self, request, pk=None):
+        """订单状态轮询：不含菜品明细，支持 ETag 条件请求，缓存的 ETag 命中时不查询数据库"""
+        user = get_wechat_user(request)
+        etag = polling.cached_etag(user.id, pk) if user else None
+        if etag and polling.etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        order = self.get_object()
+        polling.remember(order)
+        etag = polling.get_etag(order.id, order.updated_at)
+        if polling.etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(OrderStateSerializer(order).data, headers={'ETag': etag})
+    
+    def get_locked_object(self):
+        """在事务中获取并锁定订单行，同一订单的菜品修改依次执行，避免统计丢失更新"""
+        queryset = self.filter_queryset(self.get_queryset()).select_for_update()
+        order = get_object_or_404(queryset, pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, order)
+        return order
+    
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
         """添加菜品"""
-        order = self.get_object()
-        if order.status == 'completed':
-            return Response({'error': '已完成的订单不能添加菜品'}, status=status.HTTP_400_BAD_REQUEST)
-        
         serializer = OrderItemCreateSerializer(data=request.data)
-        if serializer.is_valid():
-            order_item = serializer.save(order=order)
-            
-            # 更新订单统计
-            order.item_count = order.orderitem_set.count()
-            order.calculate_total()
+        
+        with transaction.atomic():
+            order = self.get_locked_object()
+            if order.status == 'completed':
+                return Response({'error': '已完成的订单不能添加菜品'}, status=status.HTTP_400_BAD_REQUEST)
             
-            return Response(OrderItemSerializer(order_item).data)
+            if serializer.is_valid():
+                order_item = serializer.save(order=order)
+                
+                # 按增量更新订单统计
+                order.apply_item_change(order_item.subtotal, 1)
+                
+                return Response(OrderItemSerializer(order_item).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=True, methods=['delete'])
     def remove_item(self, request, pk=None):
         """删除菜品"""
-        order = self.get_object()
         item_id = request.query_params.get('item_id')
         
         if not item_id:
             return Response({'error': '缺少item_id参数'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            order_item = order.orderitem_set.get(id=item_id)
-            order_item.delete()
+        with transaction.atomic():
+            order = self.get_locked_object()
+            try:
+                order_item = order.orderitem_set.get(id=item_id)
+            except (OrderItem.DoesNotExist, ValueError):
+                return Response({'error': '菜品不存在'}, status=status.HTTP_404_NOT_FOUND)
             
-            # 更新订单统计
-            order.item_count = order.orderitem_set.count()
-            order.calculate_total()
+            order_item.delete()
             
-            return Response({'success': True})
-        except OrderItem.DoesNotExist:
-            return Response({'error': '菜品不存在'}, status=status.HTTP_404_NOT_FOUND)
+            # 按增量更新订单统计
+            order.apply_item_change(-order_item.subtotal, -1)
+        
+        return Response({'success': True})
     
     @action(detail=True, methods=['post'])
     def update_item(self, request, pk=None):
         """更新菜品数量"""
-        order = self.get_object()
-        if order.status == 'completed':
-            return Response({'error': '已完成的订单不能修改菜品'}, status=status.HTTP_400_BAD_REQUEST)
-        
         item_id = request.data.get('item_id')
         quantity = request.data.get('quantity')
         
@@ -144,33 +174,154 @@ class OrderViewSet(viewsets.ModelViewSet):
         except (ValueError, TypeError):
             return Response({'error': '数量必须是有效的整数'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            order_item = order.orderitem_set.get(id=item_id)
+        with transaction.atomic():
+            order = self.get_locked_object()
+            if order.status == 'completed':
+                return Response({'error': '已完成的订单不能修改菜品'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                order_item = order.orderitem_set.get(id=item_id)
+            except (OrderItem.DoesNotExist, ValueError):
+                return Response({'error': '菜品不存在'}, status=status.HTTP_404_NOT_FOUND)
+            
+            old_subtotal = order_item.subtotal
             order_item.quantity = quantity
             order_item.save()
             
-            # 更新订单统计
-            order.calculate_total()
+            # 按小计差额更新订单统计
+            order.apply_item_change(order_item.subtotal - old_subtotal)
+        
+        return Response(OrderItemSerializer(order_item).data)
+    
+    @action(detail=True, methods=['post'])
+    def batch_items(self, request, pk=None):
+        """批量添加、修改、删除菜品，全部成功或全部不生效，最后统一重算订单统计"""
+        serializer = OrderItemBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+        
+        with transaction.atomic():
+            order = self.get_locked_object()
+            if order.status == 'completed':
+                return Response({'error': '已完成的订单不能修改菜品'}, status=status.HTTP_400_BAD_REQUEST)
             
-            return Response(OrderItemSerializer(order_item).data)
-        except OrderItem.DoesNotExist:
-            return Response({'error': '菜品不存在'}, status=status.HTTP_404_NOT_FOUND)
+            item_ids = {op['item_id'] for op in operations if op['action'] != 'add'}
+            items = order.orderitem_set.in_bulk(item_ids)
+            
+            # 先按顺序检查全部操作，确认无误后再写入数据库
+            added, updated, removed = [], {}, set()
+            results = []
+            for op in operations:
+                if op['action'] == 'add':
+                    item = OrderItem(
+                        order=order, dish_name=op['dish_name'],
+                        unit_price=op['unit_price'], quantity=op['quantity'],
+                    )
+                    added.append(item)
+                    results.append({'op_id': op['op_id'], 'item': item})
+                    continue
+                
+                item = items.get(op['item_id'])
+                if item is None or item.id in removed:
+                    return Response(
+                        {'error': '菜品不存在', 'op_id': op['op_id']},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if op['action'] == 'update':
+                    item.quantity = op['quantity']
+                    updated[item.id] = item
+                else:
+                    removed.add(item.id)
+                    updated.pop(item.id, None)
+                results.append({'op_id': op['op_id'], 'item': item})
+            
+            if added:
+                for item in added:
+                    item.subtotal = item.unit_price * item.quantity
+                OrderItem.objects.bulk_create(added)
+                if not connection.features.can_return_rows_from_bulk_insert:
+                    # MySQL 的批量插入不返回主键；订单已加锁，最新插入的这几条即本次添加的菜品
+                    new_ids = order.orderitem_set.order_by('-id').values_list('id', flat=True)[:len(added)]
+                    for item, item_id in zip(added, reversed(list(new_ids))):
+                        item.id = item_id
+            if updated:
+                now = timezone.now()
+                for item in updated.values():
+                    item.subtotal = item.unit_price * item.quantity
+                    item.updated_at = now
+                OrderItem.objects.bulk_update(updated.values(), ['quantity', 'subtotal', 'updated_at'])
+            if removed:
+                OrderItem.objects.filter(id__in=removed).delete()
+            
+            # 全部操作完成后统一重算一次订单统计
+            order.calculate_total()
+        
+        return Response({
+            'results': [
+                {'op_id': result['op_id'], 'item_id': result['item'].id}
+                for result in results
+            ],
+            'order': OrderSerializer(order).data,
+        })
+    
+    def parse_date_param(self, name):
+        """解析 YYYY-MM-DD 日期参数，未传时返回 None，格式错误时抛出 ValueError"""
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(f'{name} 格式错误')
+        return parsed
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """订单统计"""
-        user_orders = self.get_queryset()
-        
-        stats = {
-            'total_orders': user_orders.count(),
-            'pending_orders': user_orders.filter(status='pending').count(),
-            'processing_orders': user_orders.filter(status='processing').count(),
-            'completed_orders': user_orders.filter(status='completed').count(),
-            'total_amount': sum(order.total_amount for order in user_orders),
-            'average_amount': 0,
-        }
-        
-        if stats['total_orders'] > 0:
-            stats['average_amount'] = round(stats['total_amount'] / stats['total_orders'], 2)
+        """订单统计，支持 start_date/end_date 日期范围和 top_dishes 菜品排行"""
+        user_orders = self.get_queryset().order_by()
+        
+        # 日期范围（YYYY-MM-DD，含首尾两天），转换为时间范围以便使用索引
+        try:
+            start_date = self.parse_date_param('start_date')
+            end_date = self.parse_date_param('end_date')
+            top_dishes = int(request.query_params.get('top_dishes', 0))
+            if top_dishes < 0:
+                raise ValueError('top_dishes 不能为负数')
+            top_dishes = min(top_dishes, MAX_TOP_DISHES)
+        except ValueError:
+            return Response({'error': '统计参数格式错误'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start_date:
+            user_orders = user_orders.filter(
+                created_at__gte=timezone.make_aware(datetime.combine(start_date, time.min))
+            )
+        if end_date:
+            user_orders = user_orders.filter(
+                created_at__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+            )
+        
+        # 一次聚合查询得到各状态数量和金额
+        stats = user_orders.aggregate(
+            total_orders=Count('id'),
+            pending_orders=Count('id', filter=Q(status='pending')),
+            processing_orders=Count('id', filter=Q(status='processing')),
+            completed_orders=Count('id', filter=Q(status='completed')),
+            amount_sum=Sum('total_amount'),
+            amount_avg=Avg('total_amount'),
+        )
+        stats['total_amount'] = stats.pop('amount_sum') or 0
+        stats['average_amount'] = round(stats.pop('amount_avg') or 0, 2)
+        
+        if top_dishes > 0:
+            dishes = OrderItem.objects.filter(
+                order__in=user_orders.values('id')
+            ).values('dish_name').annotate(
+                quantity=Sum('quantity'),
+                amount=Sum('subtotal'),
+            )
+            stats['top_dishes'] = {
+                'by_quantity': list(dishes.order_by('-quantity', '-amount')[:top_dishes]),
+                'by_amount': list(dishes.order_by('-amount', '-quantity')[:top_dishes]),
+            }
         
         return Response(stats)
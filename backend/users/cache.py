@@ -0,0 +1,37 @@
+"""
+openid -> 用户对象的短时缓存
+
+认证时优先从缓存读取用户，稳定状态下已登录请求不再查询用户表。
+用户资料更新、停用或删除时通过信号清除对应缓存。
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import User
+
+
+def _cache_key(openid):
+    return f'wechat_user:{openid}'
+
+
+def get_active_user(openid):
+    """按 openid 获取激活状态的用户，不存在时返回 None"""
+    ttl = getattr(settings, 'WECHAT_USER_CACHE_TTL', 60)
+    if ttl > 0:
+        user = cache.get(_cache_key(openid))
+        if user is not None:
+            return user
+
+    try:
+        user = User.objects.get(openid=openid, is_active=True)
+    except User.DoesNotExist:
+        return None
+
+    if ttl > 0:
+        cache.set(_cache_key(openid), user, ttl)
+    return user
+
+
+def invalidate_user(openid):
+    """清除用户缓存"""
+    cache.delete(_cache_key(openid))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_activity(apps, schema_editor):
+    """用已有的最后登录时间生成活跃记录"""
+    User = apps.get_model('users', 'User')
+    UserActivity = apps.get_model('users', 'UserActivity')
+    users = User.objects.exclude(last_login_at=None).values_list('id', 'last_login_at')
+
+    batch = []
+    for user_id, last_login_at in users.iterator(chunk_size=1000):
+        batch.append(UserActivity(user_id=user_id, date=timezone.localdate(last_login_at)))
+        if len(batch) >= 1000:
+            UserActivity.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        UserActivity.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='活跃日期')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.user', verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户每日活跃',
+                'verbose_name_plural': '用户每日活跃',
+                'db_table': 'user_daily_activity',
+                'indexes': [models.Index(fields=['date', 'user'], name='user_daily__date_043449_idx')],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
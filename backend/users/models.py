@@ -1,7 +1,64 @@
-from django.db import models
+from django.db import connections, models
 from django.utils import timezone
 
 
+class UserManager(models.Manager):
+    # 登录时写入的资料字段（仅新用户生效）
+    PROFILE_FIELDS = ['unionid', 'nickname', 'avatar_url', 'gender', 'city', 'province', 'country']
+
+    def upsert_login(self, openid, defaults=None):
+        """
+        登录：用一条 INSERT 语句创建用户或更新已有用户的最后登录时间，返回 (用户, 是否新用户)
+
+        SQLite/PostgreSQL 使用 ON CONFLICT ... RETURNING 直接取回用户记录；MySQL 使用
+        ON DUPLICATE KEY UPDATE，再按主键读取用户。并发的首次登录不会因唯一约束报错。
+        """
+        connection = connections[self.db]
+        profile = {field: value for field, value in (defaults or {}).items() if field in self.PROFILE_FIELDS}
+        user = self.model(openid=openid, last_login_at=timezone.now(), **profile)
+
+        # 与 Model.save() 一致：未提供的字段使用默认值，auto_now 字段取当前时间
+        opts = self.model._meta
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        params = [field.get_db_prep_save(field.pre_save(user, True), connection) for field in fields]
+        table = connection.ops.quote_name(opts.db_table)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        openid_column = connection.ops.quote_name(opts.get_field('openid').column)
+        login_column = connection.ops.quote_name(opts.get_field('last_login_at').column)
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            returning = ', '.join(connection.ops.quote_name(field.column) for field in opts.concrete_fields)
+            saved = next(iter(self.raw(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+                f'ON CONFLICT ({openid_column}) DO UPDATE SET {login_column} = excluded.{login_column} '
+                f'RETURNING {returning}',
+                params,
+            )))
+            # 已有用户不会更新创建时间
+            return saved, saved.created_at == user.created_at
+
+        if connection.vendor == 'mysql':
+            pk_column = connection.ops.quote_name(opts.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+                    f'ON DUPLICATE KEY UPDATE {login_column} = VALUES({login_column}), '
+                    f'{pk_column} = LAST_INSERT_ID({pk_column})',
+                    params,
+                )
+                # 插入新行时影响行数为1，更新已有行时为2
+                created = cursor.rowcount == 1
+                user_id = cursor.lastrowid
+            return self.get(pk=user_id), created
+
+        saved, created = self.get_or_create(openid=openid, defaults={**profile, 'last_login_at': user.last_login_at})
+        if not created:
+            saved.last_login_at = user.last_login_at
+            saved.save(update_fields=['last_login_at'])
+        return saved, created
+
+
 class User(models.Model):
     """用户表"""
     GENDER_CHOICES = [
@@ -23,6 +80,8 @@ class User(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
+    objects = UserManager()
+
     class Meta:
         db_table = 'users'
         verbose_name = '用户'
@@ -36,3 +95,29 @@ class User(models.Model):
 
     def __str__(self):
         return self.nickname or self.openid
+
+
+class UserActivity(models.Model):
+    """用户每日活跃记录表（每个用户每天一条）"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='用户')
+    date = models.DateField(verbose_name='活跃日期')
+
+    class Meta:
+        db_table = 'user_daily_activity'
+        verbose_name = '用户每日活跃'
+        verbose_name_plural = '用户每日活跃'
+        unique_together = [['user', 'date']]
+        indexes = [
+            models.Index(fields=['date', 'user']),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.date}'
+
+    @classmethod
+    def record(cls, user, date=None):
+        """记录用户当天活跃，同一天重复记录时忽略（单条 INSERT，冲突时不报错）"""
+        cls.objects.bulk_create(
+            [cls(user=user, date=date or timezone.localdate())],
+            ignore_conflicts=True,
+        )
@@ -1,3 +1,198 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .models import User
+from . import wechat
+
+
+class WechatStubServer:
+    """
+    微信接口本地桩服务：在本机随机端口模拟 jscode2session 接口
+
+    未登记的 code 返回 40029（code 无效）。设置 fail_status 可模拟服务端错误，设置 body
+    可指定返回内容，设置 delay 可模拟响应缓慢；requests 记录收到的请求参数。
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.fail_status = None
+        self.body = None
+        self.delay = 0
+        self.requests = []
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, params):
+        """返回 (状态码, 响应内容)"""
+        self.requests.append((path, params))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_status:
+            return self.fail_status, {}
+        if self.body is not None:
+            return 200, self.body
+        if path != '/sns/jscode2session':
+            return 404, {}
+        session = self.sessions.get(params.get('js_code'))
+        if session is None:
+            return 200, {'errcode': 40029, 'errmsg': 'invalid code'}
+        return 200, {'session_key': 'stub_session_key', **session}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                status, body = stub.respond(parsed.path, params)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已超时断开
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class WechatLoginTests(TestCase):
+    """微信登录（使用本地桩服务代替微信接口）"""
+
+    def setUp(self):
+        cache.clear()
+        self.stub = WechatStubServer().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(
+            WECHAT_APP_ID='wx_test', WECHAT_APP_SECRET='secret',
+            WECHAT_API_BASE_URL=self.stub.url, WECHAT_RETRY_BACKOFF=0,
+            WECHAT_MAX_RETRIES=1, WECHAT_BREAKER_THRESHOLD=2,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        wechat.get_client().breaker.reset()
+        self.addCleanup(wechat.get_client().breaker.reset)
+
+    def login(self, code):
+        return self.client.post('/api/users/users/login/', {'code': code}, content_type='application/json')
+
+    def test_login_with_code(self):
+        self.stub.sessions['code1'] = {'openid': 'wx_openid_1'}
+        response = self.login('code1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.filter(openid='wx_openid_1').exists())
+
+        # 同一个 code 重发登录请求时使用缓存结果，不再调用微信接口
+        self.assertEqual(self.login('code1').status_code, 200)
+        self.assertEqual(len(self.stub.requests), 1)
+
+        # 缓存的结果不含 session_key
+        cached = wechat.get_client().jscode2session('code1')
+        self.assertEqual(cached['openid'], 'wx_openid_1')
+        self.assertNotIn('session_key', cached)
+
+    def test_invalid_code(self):
+        response = self.login('bad_code')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.stub.requests), 1)
+
+    def test_retries_then_opens_breaker(self):
+        self.stub.fail_status = 502
+        self.assertEqual(self.login('code1').status_code, 503)
+        self.assertEqual(len(self.stub.requests), 2)  # 首次请求 + 1次重试
+
+        self.assertEqual(self.login('code2').status_code, 503)
+        self.assertEqual(len(self.stub.requests), 4)
+
+        # 连续失败达到阈值后熔断，不再请求微信接口
+        self.assertEqual(self.login('code3').status_code, 503)
+        self.assertEqual(len(self.stub.requests), 4)
+
+    @override_settings(WECHAT_BREAKER_RESET_TIMEOUT=0)
+    def test_failed_probe_reopens_breaker(self):
+        self.stub.fail_status = 502
+        self.login('code1')
+        self.login('code2')
+        self.stub.fail_status = None
+
+        # 半开状态下试探请求收到非对象的 JSON，记为失败，之后仍会放行新的试探请求
+        self.stub.body = ['unexpected']
+        self.assertEqual(self.login('code3').status_code, 503)
+
+        # 试探请求抛出意外异常，同样记为失败
+        with mock.patch.object(wechat.get_client().session, 'get', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                wechat.get_client().jscode2session('code4')
+        self.stub.body = None
+        self.stub.sessions['code5'] = {'openid': 'wx_openid_5'}
+        self.assertEqual(self.login('code5').status_code, 200)
+
+    @override_settings(WECHAT_READ_TIMEOUT=0.2, WECHAT_MAX_RETRIES=0)
+    def test_read_timeout(self):
+        self.stub.delay = 0.5
+        self.stub.sessions['code1'] = {'openid': 'wx_openid_1'}
+        self.assertEqual(self.login('code1').status_code, 503)
+
+
+class UpsertLoginTests(TestCase):
+    """登录时创建或更新用户"""
+
+    def test_creates_then_updates(self):
+        user, created = User.objects.upsert_login('wx_openid_1', defaults={'nickname': '小明', 'gender': '1'})
+        self.assertTrue(created)
+        self.assertEqual(user.nickname, '小明')
+        self.assertEqual(user.gender, 1)
+        self.assertIsNotNone(user.last_login_at)
+
+        again, created = User.objects.upsert_login('wx_openid_1', defaults={'nickname': '新昵称'})
+        self.assertFalse(created)
+        self.assertEqual(again.pk, user.pk)
+        self.assertEqual(again.nickname, '小明')  # 已有用户的资料不被覆盖
+        self.assertGreater(again.last_login_at, user.last_login_at)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_single_query(self):
+        User.objects.create(openid='wx_openid_1', nickname='小明')
+        with CaptureQueriesContext(connection) as queries:
+            user, created = User.objects.upsert_login('wx_openid_1')
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.assertEqual(len(queries), 1)
+        self.assertFalse(created)
+        self.assertEqual(user.nickname, '小明')
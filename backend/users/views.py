@@ -3,11 +3,11 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from django.utils import timezone
 from django.conf import settings
-import requests
 import logging
-from .models import User
+from .models import User, UserActivity
+from . import wechat
+from .cache import invalidate_user
 from .serializers import UserSerializer, UserCreateSerializer, UserUpdateSerializer
 
 logger = logging.getLogger(__name__)
@@ -39,47 +39,36 @@ class UserViewSet(viewsets.ModelViewSet):
         
         # 如果提供了code，通过微信API获取openid
         if code:
-            try:
-                # 检查是否配置了真实的微信参数
-                app_id = getattr(settings, 'WECHAT_APP_ID', '')
-                app_secret = getattr(settings, 'WECHAT_APP_SECRET', '')
+            # 检查是否配置了真实的微信参数
+            app_id = getattr(settings, 'WECHAT_APP_ID', '')
+            app_secret = getattr(settings, 'WECHAT_APP_SECRET', '')
+            
+            if app_id.startswith('your_') or app_secret.startswith('your_') or not app_id or not app_secret:
+                # 开发模式：使用模拟的openid
+                logger.info("使用开发模式登录，跳过微信API调用")
+                openid = f"dev_openid_{code[-8:]}"  # 使用code的后8位作为模拟openid
+            else:
+                # 生产模式：调用微信API获取openid
+                try:
+                    wx_data = wechat.get_client().jscode2session(code)
+                except wechat.WechatAPIError as e:
+                    logger.error(f"微信API错误: {e}")
+                    return Response({'error': '微信登录失败'}, status=status.HTTP_400_BAD_REQUEST)
+                except wechat.WechatUnavailable as e:
+                    logger.error(f"调用微信API异常: {e}")
+                    return Response({'error': '微信登录服务异常'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
                 
-                if app_id.startswith('your_') or app_secret.startswith('your_') or not app_id or not app_secret:
-                    # 开发模式：使用模拟的openid
-                    logger.info("使用开发模式登录，跳过微信API调用")
-                    openid = f"dev_openid_{code[-8:]}"  # 使用code的后8位作为模拟openid
-                else:
-                    # 生产模式：调用微信API获取openid
-                    wx_response = requests.get(
-                        'https://api.weixin.qq.com/sns/jscode2session',
-                        params={
-                            'appid': app_id,
-                            'secret': app_secret,
-                            'js_code': code,
-                            'grant_type': 'authorization_code'
-                        }
-                    )
-                    wx_data = wx_response.json()
-                    
-                    if 'errcode' in wx_data:
-                        logger.error(f"微信API错误: {wx_data}")
-                        return Response({'error': '微信登录失败'}, status=status.HTTP_400_BAD_REQUEST)
-                    
-                    openid = wx_data.get('openid')
-                    if not openid:
-                        return Response({'error': '获取openid失败'}, status=status.HTTP_400_BAD_REQUEST)
-                    
-            except Exception as e:
-                logger.error(f"调用微信API异常: {e}")
-                return Response({'error': '微信登录服务异常'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                openid = wx_data.get('openid')
+                if not openid:
+                    return Response({'error': '获取openid失败'}, status=status.HTTP_400_BAD_REQUEST)
         
         # 检查openid
         if not openid:
             return Response({'error': '缺少openid或code参数'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 查找或创建用户
-        user, created = User.objects.get_or_create(
-            openid=openid,
+        # 创建用户或更新最后登录时间（单条语句，并发首次登录不会冲突）
+        user, created = User.objects.upsert_login(
+            openid,
             defaults={
                 'unionid': request.data.get('unionid'),
                 'nickname': request.data.get('nickname', f'用户{openid[-8:]}'),  # 默认昵称
@@ -90,10 +79,9 @@ class UserViewSet(viewsets.ModelViewSet):
                 'country': request.data.get('country'),
             }
         )
-        
-        # 更新最后登录时间
-        user.last_login_at = timezone.now()
-        user.save(update_fields=['last_login_at'])
+        # 直接执行的 SQL 不触发 post_save 信号，手动清除用户缓存
+        invalidate_user(openid)
+        UserActivity.record(user)
         
         serializer = UserSerializer(user)
         return Response({
@@ -0,0 +1,177 @@
+"""
+微信小程序服务端接口客户端
+
+所有请求复用同一个 requests.Session（保持长连接，避免每次登录都重新建立 TLS 连接），
+并设置连接和读取超时。网络错误、超时和 5xx 响应按指数退避有限次重试；连续失败达到阈值后
+熔断一段时间，期间直接返回失败，避免微信接口故障时占满 gunicorn worker。
+接口地址可通过 WECHAT_API_BASE_URL 指向本地桩服务（见 users/tests.py）用于测试。
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class WechatError(Exception):
+    """微信接口调用失败"""
+
+
+class WechatAPIError(WechatError):
+    """微信接口返回错误码（如 code 无效），不重试"""
+
+    def __init__(self, errcode, errmsg=''):
+        super().__init__(f'{errcode}: {errmsg}')
+        self.errcode = errcode
+        self.errmsg = errmsg
+
+
+class WechatUnavailable(WechatError):
+    """微信接口不可用（网络错误、超时、服务端错误或已熔断）"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败 threshold 次后打开，reset_timeout 秒后放行一个试探请求"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def threshold(self):
+        return _setting('WECHAT_BREAKER_THRESHOLD', 5)
+
+    @property
+    def reset_timeout(self):
+        return _setting('WECHAT_BREAKER_RESET_TIMEOUT', 30)
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def allow(self):
+        """是否允许发出请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.error('微信接口连续失败 %s 次，暂停调用 %s 秒', self._failures, self.reset_timeout)
+                self._opened_at = time.monotonic()
+
+
+class WechatClient:
+    """微信接口客户端（进程内共享）"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_setting('WECHAT_POOL_SIZE', 10), max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.breaker = CircuitBreaker()
+
+    def jscode2session(self, code):
+        """
+        用小程序登录 code 换取 openid、unionid 和 session_key
+
+        同一个 code 只能使用一次，成功结果按 code 缓存 WECHAT_CODE_CACHE_TTL 秒，
+        客户端因网络问题重发登录请求时直接返回缓存结果。缓存只保存 openid 和 unionid，
+        不保存 session_key。
+        """
+        cache_key = 'wechat_code:' + hashlib.sha256(code.encode()).hexdigest()
+        data = cache.get(cache_key)
+        if data is not None:
+            return data
+
+        data = self._get('/sns/jscode2session', {
+            'appid': settings.WECHAT_APP_ID,
+            'secret': settings.WECHAT_APP_SECRET,
+            'js_code': code,
+            'grant_type': 'authorization_code',
+        })
+        cached = {key: data[key] for key in ('openid', 'unionid') if key in data}
+        cache.set(cache_key, cached, _setting('WECHAT_CODE_CACHE_TTL', 300))
+        return data
+
+    def _get(self, path, params):
+        """发出 GET 请求，网络错误、超时和 5xx 响应按指数退避重试"""
+        if not self.breaker.allow():
+            raise WechatUnavailable('微信接口已熔断')
+
+        url = _setting('WECHAT_API_BASE_URL', 'https://api.weixin.qq.com').rstrip('/') + path
+        timeout = (_setting('WECHAT_CONNECT_TIMEOUT', 2), _setting('WECHAT_READ_TIMEOUT', 3))
+        retries = _setting('WECHAT_MAX_RETRIES', 2)
+        backoff = _setting('WECHAT_RETRY_BACKOFF', 0.2)
+
+        recorded = False
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    time.sleep(backoff * 2 ** (attempt - 1))
+                try:
+                    response = self.session.get(url, params=params, timeout=timeout)
+                    if response.status_code >= 500:
+                        raise WechatUnavailable(f'微信接口返回 {response.status_code}')
+                    data = response.json() if response.ok else None
+                    if data is not None and not isinstance(data, dict):
+                        raise WechatUnavailable('微信接口返回格式无效')
+                except (requests.RequestException, ValueError, WechatUnavailable) as e:
+                    logger.warning('调用微信接口失败（第 %s 次）: %s', attempt + 1, e)
+                    error = e
+                    continue
+
+                self.breaker.record_success()
+                recorded = True
+                if data is None:
+                    raise WechatAPIError(response.status_code, response.reason)
+                if data.get('errcode'):
+                    raise WechatAPIError(data['errcode'], data.get('errmsg', ''))
+                return data
+
+            self.breaker.record_failure()
+            recorded = True
+            raise WechatUnavailable(str(error))
+        finally:
+            # 意外异常同样记为失败，否则半开状态下的试探请求出错后熔断器不再放行任何请求
+            if not recorded:
+                self.breaker.record_failure()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """获取进程内共享的客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = WechatClient()
+        return _client
@@ -68,7 +68,7 @@ const PostCard: React.FC<PostCardProps> = ({ post, showDistance = false }) => {
             <View key={img.id} className="image-item">
               <Image 
                 className="post-image" 
-                src={img.image_url} 
+                src={img.thumbnail_url || img.image_url} 
                 mode="aspectFill"
                 onError={() => console.log('图片加载失败:', img.image_url)}
                 onLoad={() => console.log('图片加载成功:', img.image_url)}
@@ -34,7 +34,7 @@ const Community = () => {
   const [isLoading, setIsLoading] = useState(false)
   const [isLoggedIn, setIsLoggedIn] = useState(false)
   const [hasMore, setHasMore] = useState(true)
-  const [currentPage, setCurrentPage] = useState(1)
+  const [nextUrl, setNextUrl] = useState<string | null>(null) // 下一页链接（距离排序时为游标链接）
   const [hasInitialLoad, setHasInitialLoad] = useState(false) // 跟踪是否已进行初始加载
   
   // 排序状态
@@ -78,14 +78,14 @@ const Community = () => {
   }, [currentSort])
 
   // 加载帖子列表
-  const loadPosts = useCallback(async (sortType: SortType = 'distance', page: number = 1, isRefresh: boolean = true) => {
+  // next 为上一页返回的下一页链接，不传时从第一页重新加载
+  const loadPosts = useCallback(async (sortType: SortType = 'distance', next: string | null = null) => {
     try {
       setIsLoading(true)
       
       let ordering = '-created_at' // 默认按创建时间倒序
       let params: any = {
-        page_size: 5, // 修改为5条每页
-        page: page
+        page_size: 5 // 修改为5条每页
       }
       
       // 根据排序类型设置参数
@@ -113,7 +113,8 @@ const Community = () => {
         params.ordering = ordering
       }
       
-      const response = await CommunityAPI.getPosts(params)
+      // 加载更多时沿接口返回的 next 链接翻页，距离排序的深层页面与第一页开销相同
+      const response = next ? await CommunityAPI.getNextPosts(next) : await CommunityAPI.getPosts(params)
       
       if (response.results) {
         // 为每个帖子计算距离（只用于显示，不用于排序）
@@ -128,7 +129,7 @@ const Community = () => {
           return post
         })
         
-        if (isRefresh || page === 1) {
+        if (!next) {
           // 如果是刷新或第一页，直接设置新数据
           setPosts(postsWithDistance)
         } else {
@@ -138,7 +139,7 @@ const Community = () => {
         
         // 更新分页状态
         setHasMore(!!response.next)
-        setCurrentPage(page)
+        setNextUrl(response.next)
       }
     } catch (error) {
       console.error('加载帖子失败:', error)
@@ -165,7 +166,7 @@ const Community = () => {
     
     if (shouldReload) {
       console.log('位置信息获取成功，重新加载帖子列表以计算距离')
-      loadPosts(currentSort, 1, true)
+      loadPosts(currentSort)
     }
     
     // 更新ref中的状态
@@ -179,7 +180,7 @@ const Community = () => {
   const checkLoginAndLoadPosts = useCallback(async () => {
     const loggedIn = AuthService.isLoggedIn()
     setIsLoggedIn(loggedIn)
-    await loadPosts(currentSort, 1, true)
+    await loadPosts(currentSort)
     setHasInitialLoad(true) // 标记已完成初始加载
   }, [loadPosts, currentSort])
 
@@ -187,8 +188,8 @@ const Community = () => {
   const loadMorePosts = useCallback(async () => {
     if (!hasMore || isLoading) return
     
-    await loadPosts(currentSort, currentPage + 1, false)
-  }, [hasMore, isLoading, currentSort, currentPage, loadPosts])
+    await loadPosts(currentSort, nextUrl)
+  }, [hasMore, isLoading, currentSort, nextUrl, loadPosts])
 
   Taro.useDidShow(() => {
     checkLoginAndLoadPosts()
@@ -243,7 +244,7 @@ const Community = () => {
   const handleRefreshLocation = useCallback(async () => {
     await refreshLocation()
     // 重新定位后，刷新帖子列表
-    await loadPosts(currentSort, 1, true)
+    await loadPosts(currentSort)
   }, [refreshLocation, loadPosts, currentSort])
 
   // 处理tab切换
@@ -266,7 +267,7 @@ const Community = () => {
     setCurrentSort(sortType)
     setCurrentPage(1)
     setHasMore(true)
-    await loadPosts(sortType, 1, true)
+    await loadPosts(sortType)
   }, [loadPosts])
 
   // 发布推荐
@@ -322,7 +323,7 @@ const Community = () => {
       setSelectedImages([])
       setCurrentPage(1)
       setHasMore(true)
-      await loadPosts(currentSort, 1, true)
+      await loadPosts(currentSort)
       
     } catch (error) {
       console.error('发布失败:', error)
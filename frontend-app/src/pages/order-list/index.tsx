@@ -117,7 +117,7 @@ const OrderList = () => {
               </View>
               <View className="order-content">
                 <Text className="order-items">
-                  {order.items?.length || 0} 个菜品
+                  {order.item_count || 0} 个菜品
                 </Text>
                 <Text className="order-amount">¥{order.total_amount}</Text>
               </View>
@@ -50,7 +50,8 @@ const OrderPage = () => {
     try {
       const response = await OrderAPI.getOrders({
         ordering: '-created_at',
-        page_size: 1
+        page_size: 1,
+        expand: 'items'
       })
       
       if (response.results && response.results.length > 0) {
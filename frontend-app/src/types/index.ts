@@ -62,7 +62,7 @@ export interface Post {
   latitude?: number
   longitude?: number
   location_address?: string
-  images: Array<{ id: number; image_url: string }>
+  images: Array<{ id: number; image_url: string; thumbnail_url?: string; webp_url?: string }>
   likes_count: number
   view_count: number
   is_liked: boolean
@@ -99,6 +99,7 @@ export class OrderAPI {
     page?: number
     page_size?: number
     ordering?: string
+    expand?: string  // 传 'items' 时返回菜品明细
   }) {
     const queryStr = params ? '?' + new URLSearchParams(params as any).toString() : ''
     return request({
@@ -266,6 +267,21 @@ export class CommunityAPI {
     })
   }
 
+  // 按列表接口返回的 next 链接获取下一页（距离排序时为游标链接）
+  static async getNextPosts(next: string): Promise<{
+    count: number
+    next: string | null
+    previous: string | null
+    results: any[]
+  }> {
+    const index = next.indexOf('?')
+    const queryStr = index >= 0 ? next.slice(index) : ''
+    return request({
+      url: `/community/posts/${queryStr}`,
+      method: 'GET'
+    })
+  }
+
   // 获取分享详情
   static async getPostDetail(postId: number) {
     return request({